@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from function import read_topology, clear_spectrum, get_path_table, get_backup_sharing, release_allocations
+from path_cache import load_candidate_paths
+from path_engine import compute_k_disjoint_paths
+from path_table import rounded_traffic
+from shared_protection import cheapest_backup, path_bitset
+
+
+# protection schemes an AllocationService provisions
+schemes = ('1+1', '1:1', 'shared')
+
+
+class AllocationService:
+    '''thread-safe provisioning and release of protected demands on one spectrum
+
+    Links are sharded over num_shards locks. A request searches for dedicated spectrum without any lock, then locks
+    the shards of the links it picked, checks that the block is still free and occupies it. When another request
+    took the block in between, the search is retried, up to max_retries times. Shared backups are ranked with the
+    links of all their candidates locked, as their sharing ledger moves with other backups. Requests on disjoint
+    links only share the commit lock held while the occupied-cell counters are updated.
+    '''
+
+    def __init__(self, G, k_paths, num_shards=64, max_retries=8):
+        if 'spectrum' not in G.graph:
+            raise ValueError("The graph spectrum must be initialised with clear_spectrum.")
+        self.G = G
+        self.store = G.graph['spectrum']
+        self.path_table = get_path_table(G, k_paths)
+        self.sharing = get_backup_sharing(G)
+        self.ledger = G.graph.get('resource_ledger')
+
+        self.num_shards = num_shards
+        self.shard_locks = [threading.Lock() for _ in range(num_shards)]
+        self.commit_lock = threading.Lock()
+        self.max_retries = max_retries
+
+        # {handle: (scheme, allocation records)} of the demands in service
+        self.connections = {}
+        self.handles = itertools.count()
+        self.conflicts = 0
+
+    @contextmanager
+    def _locked(self, edge_ids):
+        # shards are always taken in increasing order, so that two requests never wait on each other
+        shards = sorted({edge_id % self.num_shards for edge_id in edge_ids.tolist()})
+        for shard in shards:
+            self.shard_locks[shard].acquire()
+        try:
+            yield
+        finally:
+            for shard in reversed(shards):
+                self.shard_locks[shard].release()
+
+    def _conflict(self):
+        with self.commit_lock:
+            self.conflicts += 1
+
+    def _claim_dedicated(self, scheme, role, rows, traffic_G):
+        '''(row, first slot, number of slots) of the first candidate row with room, occupied, None if none has'''
+        path_table = self.path_table
+        edge_ids_list = [path_table.path_edge_ids(row) for row in rows]
+        num_slots_list = [path_table.slots(row, traffic_G) for row in rows]
+
+        for attempt in range(self.max_retries + 1):
+            first_slots = self.store.first_fit_paths(edge_ids_list, num_slots_list)
+            fitting = np.flatnonzero(first_slots >= 0)
+            if not len(fitting):
+                return None
+            i = int(fitting[0])
+            edge_ids, first_slot, num_slots = edge_ids_list[i], int(first_slots[i]), num_slots_list[i]
+
+            with self._locked(edge_ids):
+                if self.store.is_free(edge_ids, first_slot, num_slots):
+                    with self.commit_lock:
+                        if self.ledger is not None:
+                            self.ledger.add(scheme, role, edge_ids, first_slot, num_slots)
+                        self.store.occupy(edge_ids, first_slot, num_slots)
+                    return rows[i], first_slot, num_slots
+            self._conflict()
+        return None
+
+    def _claim_available(self, rows, traffic_G):
+        '''like _claim_dedicated, with the block also free on every other link leaving the path nodes (1:1)'''
+        path_table = self.path_table
+        for attempt in range(self.max_retries + 1):
+            for row in rows:
+                path = path_table.paths[row]
+                edge_ids = path_table.path_edge_ids(row)
+                num_slots = path_table.slots(row, traffic_G)
+                adjacent_edge_ids = np.concatenate([self.store.incident_edge_ids[node] for node in path[:-1]])
+                first_slot = self.store.first_fit(edge_ids, num_slots)
+                if first_slot is not None and self.store.is_free(adjacent_edge_ids, first_slot, num_slots):
+                    break
+            else:
+                return None
+
+            with self._locked(adjacent_edge_ids):
+                if self.store.is_free(adjacent_edge_ids, first_slot, num_slots):
+                    with self.commit_lock:
+                        if self.ledger is not None:
+                            self.ledger.add('1:1', 'primary', edge_ids, first_slot, num_slots)
+                        self.store.occupy(edge_ids, first_slot, num_slots)
+                    return row, first_slot, num_slots
+            self._conflict()
+        return None
+
+    def _claim_shared(self, rows, traffic_G, primary_bitset):
+        '''(row, first slot, number of slots, sharing id) of the backup row adding the fewest new backup cells
+
+        The sharing ledger of a cell changes with the backups of other requests, so the rows are ranked with the
+        locks of all their links held, as in k_shortest_path_shared_protection.
+        '''
+        if not rows:
+            return None
+        path_table = self.path_table
+        edge_ids_list = [path_table.path_edge_ids(row) for row in rows]
+        num_slots_list = [path_table.slots(row, traffic_G) for row in rows]
+        with self._locked(np.concatenate(edge_ids_list)):
+            backup = cheapest_backup(self.sharing, edge_ids_list, num_slots_list, primary_bitset)
+            if backup is None:
+                return None
+            i, first_slot = backup
+            edge_ids, num_slots = edge_ids_list[i], num_slots_list[i]
+            with self.commit_lock:
+                if self.ledger is not None:
+                    self.ledger.add('shared', 'backup', edge_ids, first_slot, num_slots)
+                sharing_id = self.sharing.allocate(edge_ids, first_slot, num_slots, primary_bitset)
+            return rows[i], first_slot, num_slots, sharing_id
+
+    def provision(self, src_id, dst_id, traffic_G, scheme='1+1'):
+        '''(handle, allocation records) of a new demand, (None, []) when it is blocked
+
+        Protected schemes need both a primary and a backup, a demand only half allocated is given back. Raises
+        ValueError for an unknown scheme or traffic no modulation format carries.
+        '''
+        if scheme not in schemes:
+            raise ValueError('unknown protection scheme {!r}'.format(scheme))
+        traffic_G = rounded_traffic(traffic_G)
+        path_table = self.path_table
+        primary_row, *backup_rows = path_table.rows(src_id, dst_id)
+
+        records = []
+        if scheme == '1:1':
+            claim = self._claim_available([primary_row] + backup_rows, traffic_G)
+            if claim is None:
+                # as in k_shortest_path_first_fit_1_to_1_RSA, the primary keeps a free block whose neighbours are busy
+                # when no candidate is fully available
+                claim = self._claim_dedicated('1:1', 'primary', [primary_row], traffic_G)
+            if claim is not None:
+                row, first_slot, num_slots = claim
+                records.append((path_table.paths[row], first_slot, num_slots, None))
+        else:
+            claim = self._claim_dedicated(scheme, 'primary', [primary_row], traffic_G)
+            if claim is not None:
+                row, first_slot, num_slots = claim
+                records.append((path_table.paths[row], first_slot, num_slots, None))
+
+                if scheme == '1+1':
+                    claim = self._claim_dedicated(scheme, 'backup', backup_rows, traffic_G) if backup_rows else None
+                    if claim is not None:
+                        row, first_slot, num_slots = claim
+                        records.append((path_table.paths[row], first_slot, num_slots, None))
+                else:
+                    primary_bitset = path_bitset(path_table.path_edge_ids(primary_row))
+                    claim = self._claim_shared(backup_rows, traffic_G, primary_bitset)
+                    if claim is not None:
+                        row, first_slot, num_slots, sharing_id = claim
+                        records.append((path_table.paths[row], first_slot, num_slots, sharing_id))
+
+        if len(records) < (1 if scheme == '1:1' else 2):
+            self._release_records(records, scheme)
+            return None, []
+
+        handle = next(self.handles)
+        self.connections[handle] = (scheme, records)
+        return handle, records
+
+    def _release_records(self, records, scheme):
+        if not records:
+            return
+        edge_ids = np.concatenate([self.store.path_edge_ids(path) for path, _, _, _ in records])
+        with self._locked(edge_ids):
+            with self.commit_lock:
+                release_allocations(self.G, records, scheme)
+
+    def release(self, handle):
+        '''give back the spectrum of a provisioned demand'''
+        scheme, records = self.connections.pop(handle)
+        self._release_records(records, scheme)
+
+
+async def serve(service, host='127.0.0.1', port=8765, max_workers=8):
+    '''JSON lines server of an AllocationService, every connection and request handled concurrently
+
+    {"op": "provision", "src": 0, "dst": 5, "traffic": 400, "scheme": "1+1"} returns {"handle": ..., "paths": ...},
+    {"op": "release", "handle": ...} returns {"released": ...}.
+    '''
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def answer(request):
+        if request['op'] == 'provision':
+            handle, records = await loop.run_in_executor(executor, service.provision, request['src'],
+                                                         request['dst'], request['traffic'],
+                                                         request.get('scheme', '1+1'))
+            return {'handle': handle, 'paths': [path for path, _, _, _ in records]}
+        if request['op'] == 'release':
+            await loop.run_in_executor(executor, service.release, request['handle'])
+            return {'released': request['handle']}
+        return {'error': 'unknown op {}'.format(request['op'])}
+
+    async def handle_connection(reader, writer):
+        write_lock = asyncio.Lock()
+
+        async def respond(line):
+            try:
+                response = await answer(json.loads(line))
+            except Exception as error:
+                # a bad request gets an error reply, the other requests of the connection go on
+                response = {'error': repr(error)}
+            async with write_lock:
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+
+        requests = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = asyncio.create_task(respond(line))
+                requests.add(request)
+                request.add_done_callback(requests.discard)
+        finally:
+            # a reply that could not be written, to a peer gone meanwhile, must not keep the connection open
+            await asyncio.gather(*requests, return_exceptions=True)
+            writer.close()
+
+    server = await asyncio.start_server(handle_connection, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON lines provisioning service over one topology')
+    parser.add_argument('--topology', default='IT_21.json')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--num-slots', type=int, default=400)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    G = read_topology(args.topology)
+    G.graph['num_slots'] = args.num_slots
+    clear_spectrum(G, args.num_slots)
+    k_paths = load_candidate_paths(args.topology, G, compute_k_disjoint_paths)
+
+    asyncio.run(serve(AllocationService(G, k_paths), args.host, args.port, args.workers))
+
+
+if __name__ == '__main__':
+    main()
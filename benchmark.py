@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from function import read_topology, clear_spectrum, generate_demands, set_priority, spectrum_occupation, \
+    get_path_table, compute_k_edge_disjoint_paths
+from experiment import schemes
+from path_engine import compute_k_disjoint_paths
+from topology_generator import generators, write_topology
+
+path_computations = {'disjoint': compute_k_disjoint_paths,
+                     'networkx': compute_k_edge_disjoint_paths}
+
+
+def time_stage(stages, stage, count, function, *args, trace_memory=False, **kwargs):
+    '''run one stage, record its wall time, its items per second and optionally its peak traced memory'''
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    stages[stage] = {'seconds': seconds,
+                     'count': count(result) if callable(count) else count,
+                     'peak_kib': None}
+    stages[stage]['per_second'] = stages[stage]['count'] / seconds if seconds > 0 else None
+    if trace_memory:
+        stages[stage]['peak_kib'] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return result
+
+
+def benchmark_case(filename, num_slots=400, seed=0, deletion_percent=0.2, compute=compute_k_disjoint_paths,
+                   num_candidate_paths=10, num_workers=1, trace_memory=False):
+    '''stage timings of one topology and slot count, from reading the JSON to the end-of-run accounting'''
+    stages = {}
+    stage = lambda *args, **kwargs: time_stage(stages, *args, trace_memory=trace_memory, **kwargs)
+
+    G = stage('read_topology', lambda G: G.number_of_edges(), read_topology, filename)
+    G.graph['num_slots'] = num_slots
+
+    random.seed(seed)
+    traffic_dict = stage('generate_demands', len, generate_demands, G, deletion_percent)
+    traffic_splits = stage('set_priority', len(traffic_dict), set_priority, traffic_dict)
+
+    k_paths = stage('compute_paths', len, compute, G, num_candidate_paths=num_candidate_paths,
+                    num_workers=num_workers)
+    stage('path_table', lambda path_table: len(path_table.paths), get_path_table, G, k_paths)
+
+    occupied_slots = {}
+    for name, (RSA, split, count_transponders) in schemes.items():
+        clear_spectrum(G, num_slots)
+        chosen_paths = stage('rsa_' + name, len, RSA, G, k_paths, traffic_splits[split])
+        occupied_slots[name] = stage('accounting_' + name, len(chosen_paths),
+                                     lambda: (count_transponders(G, chosen_paths, traffic_splits[split]),
+                                              spectrum_occupation(G)))[1]
+    clear_spectrum(G, num_slots)
+
+    return {'num_nodes': G.number_of_nodes(),
+            'num_links': G.number_of_edges(),
+            'num_slots': num_slots,
+            'num_demands': len(traffic_dict),
+            'occupied_slots': occupied_slots,
+            'stages': stages}
+
+
+def benchmark_cases(topologies, sizes, slot_counts, seed=0):
+    '''(case name, topology file) of every requested topology, generated ones written to a temporary folder'''
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as folder:
+        for topology in topologies:
+            if topology not in generators:
+                name = os.path.splitext(os.path.basename(topology))[0]
+                for num_slots in slot_counts:
+                    yield '{}_s{}'.format(name, num_slots), topology, num_slots
+                continue
+
+            for num_nodes in sizes:
+                filename = os.path.join(folder, '{}_{}.json'.format(topology, num_nodes))
+                write_topology(generators[topology](num_nodes, seed=seed), filename)
+                for num_slots in slot_counts:
+                    yield '{}_n{}_s{}'.format(topology, num_nodes, num_slots), filename, num_slots
+
+
+def find_regressions(results, baseline, tolerance=0.25, min_seconds=0.01):
+    '''(case, stage, baseline seconds, seconds) of the stages slower than the baseline by more than tolerance
+
+    Stages faster than min_seconds in both runs are timer noise and never flagged.
+    '''
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        for stage, timing in result['stages'].items():
+            reference = baseline[case]['stages'].get(stage)
+            if reference is None or max(timing['seconds'], reference['seconds']) < min_seconds:
+                continue
+            if timing['seconds'] > reference['seconds'] * (1 + tolerance):
+                regressions.append((case, stage, reference['seconds'], timing['seconds']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='per-stage timings of the RSA pipeline')
+    parser.add_argument('--topologies', nargs='+', default=['IT_21.json', 'waxman', 'grid', 'ring-mesh'],
+                        help='topology files or generators: ' + ', '.join(generators))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20, 50, 100], help='nodes of generated topologies')
+    parser.add_argument('--slots', type=int, nargs='+', default=[400, 4000])
+    parser.add_argument('--paths', default='disjoint', choices=list(path_computations))
+    parser.add_argument('--num-candidate-paths', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--memory', action='store_true', help='trace peak memory per stage, slows the stages down')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    results = {}
+    for case, filename, num_slots in benchmark_cases(args.topologies, args.sizes, args.slots, args.seed):
+        # the candidate paths change every stage timing, a baseline is only compared with runs computing the same
+        case = '{}_{}_k{}'.format(case, args.paths, args.num_candidate_paths)
+        result = benchmark_case(filename, num_slots, args.seed, compute=path_computations[args.paths],
+                                num_candidate_paths=args.num_candidate_paths, num_workers=args.workers,
+                                trace_memory=args.memory)
+        results[case] = result
+
+        print('{}: {} nodes, {} links, {} demands'.format(case, result['num_nodes'], result['num_links'],
+                                                         result['num_demands']))
+        for stage, timing in result['stages'].items():
+            memory = '' if timing['peak_kib'] is None else ', {:.0f} KiB peak'.format(timing['peak_kib'])
+            rate = '' if timing['per_second'] is None else ', {:.0f}/s'.format(timing['per_second'])
+            print('  {:<20} {:9.4f} s{}{}'.format(stage, timing['seconds'], rate, memory))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.memory:
+        print('timings traced with --memory are not compared with the baseline')
+        return
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for case, stage, reference, seconds in regressions:
+            print('REGRESSION {} {}: {:.4f} s -> {:.4f} s'.format(case, stage, reference, seconds))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import itertools
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+
+import networkx as nx
+import numpy as np
+
+from path_engine import adjacency, iter_shortest_paths, path_links
+from path_table import MF_num_slots
+from spectrum import edge_index
+
+
+class PairCandidates:
+    '''candidate paths of one node pair generated so far, with their edge ids and lengths'''
+
+    __slots__ = ('paths', 'edge_ids', 'length', 'generator')
+
+    def __init__(self, generator):
+        self.paths = []
+        self.edge_ids = []
+        self.length = []
+        # None once the pair has no more candidates
+        self.generator = generator
+
+
+class CandidateRows(Sequence):
+    '''rows of the candidate paths of a node pair from position start on, generated as they are read'''
+
+    __slots__ = ('provider', 'pair', 'start')
+
+    def __init__(self, provider, pair, start=0):
+        self.provider = provider
+        self.pair = pair
+        self.start = start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            if i.step not in (None, 1) or i.stop is not None or (i.start or 0) < 0:
+                return list(self)[i]
+            return CandidateRows(self.provider, self.pair, self.start + (i.start or 0))
+        if i < 0:
+            return list(self)[i]
+        if not self.provider.has_candidate(self.pair, self.start + i):
+            raise IndexError('candidate {} of {} does not exist'.format(self.start + i, self.pair))
+        return self.pair + (self.start + i,)
+
+    def __iter__(self):
+        for position in itertools.count(self.start):
+            if not self.provider.has_candidate(self.pair, position):
+                return
+            yield self.pair + (position,)
+
+    def __len__(self):
+        '''number of rows, which generates every candidate of the pair'''
+        return sum(1 for _ in self)
+
+
+class _CandidatePathsView:
+    '''path_table.paths[row] of a LazyCandidatePaths'''
+
+    __slots__ = ('provider',)
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    def __getitem__(self, row):
+        return self.provider.candidate(row).paths[row[2]]
+
+
+class LazyCandidatePaths(Mapping):
+    '''candidate paths of every node pair, computed one at a time when an RSA function asks for them
+
+    Works as the k_SP_dict of the RSA functions and as their path table. The primary of a pair is its shortest
+    path and its backups the next shortest paths avoiding the links of the primary, as in
+    compute_k_shortest_backup_paths, but a backup is only computed when the RSA loop reaches it. The candidates of
+    at most max_pairs pairs are memoized, the least recently used pair is dropped first and computed again when it
+    comes back. Rows are (src, dst, position) tuples. The memo is guarded by a lock, so that one provider can serve
+    several threads, such as the ones of an AllocationService.
+    '''
+
+    def __init__(self, G, num_candidate_paths=10, max_pairs=4096):
+        self.G = G
+        self.num_candidate_paths = num_candidate_paths
+        self.max_pairs = max_pairs
+        self.out_links, _ = adjacency(G)
+        self.edge_index = edge_index(G)
+        self.edge_length = np.array([length for _, _, length in G.edges(data='length')], dtype=float)
+        self.pairs = OrderedDict()
+        # the memo order and the pair generators are shared between threads
+        self.lock = threading.Lock()
+        self.paths = _CandidatePathsView(self)
+        self.num_generated = 0
+
+    @property
+    def k_paths(self):
+        # get_path_table keeps one path table per candidate dict, this one is its own
+        return self
+
+    def _generate(self, src_id, dst_id):
+        try:
+            primary_path = nx.dijkstra_path(self.G, src_id, dst_id, weight='length')
+        except nx.NetworkXNoPath:
+            return
+        yield primary_path
+        backups = iter_shortest_paths(self.out_links, src_id, dst_id, path_links(self.G, primary_path))
+        yield from itertools.islice(backups, max(self.num_candidate_paths, 1))
+
+    def candidate(self, row):
+        '''PairCandidates holding row, generated up to it'''
+        src_id, dst_id, position = row
+        candidates = self.pair_candidates((src_id, dst_id), position + 1)
+        if position >= len(candidates.paths):
+            raise KeyError(row)
+        return candidates
+
+    def pair_candidates(self, pair, count):
+        '''PairCandidates of a pair with at least count candidates generated, or all of them if it has fewer'''
+        with self.lock:
+            return self._pair_candidates(pair, count)
+
+    def _pair_candidates(self, pair, count):
+        candidates = self.pairs.get(pair)
+        if candidates is None:
+            candidates = PairCandidates(self._generate(*pair))
+            self.pairs[pair] = candidates
+            if len(self.pairs) > self.max_pairs:
+                self.pairs.popitem(last=False)
+        else:
+            self.pairs.move_to_end(pair)
+
+        while len(candidates.paths) < count and candidates.generator is not None:
+            path = next(candidates.generator, None)
+            if path is None:
+                candidates.generator = None
+                break
+            edge_ids = np.fromiter((self.edge_index[link] for link in zip(path, path[1:])),
+                                   dtype=np.intp, count=len(path) - 1)
+            candidates.paths.append(path)
+            candidates.edge_ids.append(edge_ids)
+            candidates.length.append(float(self.edge_length[edge_ids].sum()))
+            self.num_generated += 1
+        return candidates
+
+    def has_candidate(self, pair, position):
+        return position < len(self.pair_candidates(pair, position + 1).paths)
+
+    def __getitem__(self, pair):
+        '''every candidate path of a pair, as in a k_SP_dict'''
+        if pair[0] not in self.out_links or pair[1] not in self.out_links:
+            raise KeyError(pair)
+        return list(self.pair_candidates(pair, self.num_candidate_paths + 1).paths)
+
+    def __iter__(self):
+        '''the node pairs with src_id < dst_id, without computing their paths'''
+        for src_id in self.G.nodes():
+            for dst_id in self.G.nodes():
+                if src_id < dst_id:
+                    yield src_id, dst_id
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def clear(self):
+        '''forget every memoized candidate, after the topology changed'''
+        with self.lock:
+            self.out_links, _ = adjacency(self.G)
+            self.edge_index = edge_index(self.G)
+            self.edge_length = np.array([length for _, _, length in self.G.edges(data='length')], dtype=float)
+            self.pairs.clear()
+
+    # path table interface of the RSA functions
+
+    def rows(self, src_id, dst_id):
+        return CandidateRows(self, (src_id, dst_id))
+
+    def row_batches(self, rows):
+        '''rows in batches of 1, 2, 4 ... so that a batched First-Fit computes at most twice the rows it needs'''
+        rows = iter(rows)
+        size = 1
+        while True:
+            batch = list(itertools.islice(rows, size))
+            if not batch:
+                return
+            yield batch
+            size *= 2
+
+    def find(self, path):
+        '''row of a memoized candidate path, None if it is not memoized'''
+        with self.lock:
+            candidates = self.pairs.get((path[0], path[-1]))
+            if candidates is None or path not in candidates.paths:
+                return None
+            return path[0], path[-1], candidates.paths.index(path)
+
+    def path_edge_ids(self, row):
+        return self.candidate(row).edge_ids[row[2]]
+
+    def slots(self, row, traffic_G):
+        return MF_num_slots(self.candidate(row).length[row[2]], int(traffic_G))
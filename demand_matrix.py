@@ -0,0 +1,132 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+from path_table import traffic_classes
+
+# shares of every demand carried by 1+1, 1:1 and shared protection, as in set_priority
+priority_shares = (0.6, 0.2, 0.2)
+
+
+class DemandMatrix:
+    '''traffic demands as parallel arrays: source and destination node ids, Gb/s and traffic class column'''
+
+    __slots__ = ('src', 'dst', 'traffic', 'traffic_class', '_num_ids', '_keys', '_key_rows')
+
+    def __init__(self, src, dst, traffic):
+        self.src = src
+        self.dst = dst
+        self.traffic = traffic
+        self.traffic_class = (traffic // 100 - 1).astype(np.int8)
+        # src * num_ids + dst of every demand in sorted order and the row of each, built on the first lookup
+        self._num_ids = None
+        self._keys = None
+        self._key_rows = None
+
+    def __len__(self):
+        return len(self.src)
+
+    def _index(self):
+        if self._keys is None:
+            self._num_ids = int(max(self.src.max(), self.dst.max())) + 1 if len(self.src) else 1
+            keys = self.src.astype(np.int64) * self._num_ids + self.dst
+            self._key_rows = np.argsort(keys, kind='stable')
+            self._keys = keys[self._key_rows]
+        return self._keys
+
+    def rows(self, src, dst):
+        '''positions of the (src, dst) demands given as arrays, -1 where there is no such demand'''
+        keys = self._index()
+        src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+        if not len(keys):
+            return np.full(np.broadcast(src, dst).shape, -1, dtype=np.intp)
+        pair_keys = src * self._num_ids + dst
+        i = np.minimum(keys.searchsorted(pair_keys), len(keys) - 1)
+        # ids out of range could alias the key of another pair
+        found = (keys[i] == pair_keys) & (src >= 0) & (dst >= 0) & (src < self._num_ids) & (dst < self._num_ids)
+        return np.where(found, self._key_rows[i], -1)
+
+    def row(self, pair):
+        '''position of a (src, dst) demand, found by bisecting the sorted pair keys without any per-pair dict'''
+        keys = self._index()
+        src_id, dst_id = pair
+        if not (0 <= src_id < self._num_ids and 0 <= dst_id < self._num_ids):
+            raise KeyError(pair)
+        key = src_id * self._num_ids + dst_id
+        i = int(keys.searchsorted(key))
+        if i == len(keys) or keys[i] != key:
+            raise KeyError(pair)
+        return int(self._key_rows[i])
+
+    def split(self, share):
+        '''demands scaled by share, as a read-only traffic dict sharing the arrays of the matrix'''
+        return DemandView(self, share)
+
+    def splits(self):
+        '''views for 1+1, 1:1 and shared protection, like the dicts set_priority returns'''
+        return tuple(self.split(share) for share in priority_shares)
+
+    def to_dict(self):
+        return dict(zip(zip(self.src.tolist(), self.dst.tolist()), self.traffic.tolist()))
+
+
+class DemandView(Mapping):
+    '''{(src, dst): Gb/s} view of a DemandMatrix with every demand scaled by share, accepted as a traffic_dict'''
+
+    __slots__ = ('demands', 'share')
+
+    def __init__(self, demands, share=1.0):
+        self.demands = demands
+        self.share = share
+
+    def __getitem__(self, pair):
+        return float(self.demands.traffic[self.demands.row(pair)]) * self.share
+
+    def __iter__(self):
+        return zip(self.demands.src.tolist(), self.demands.dst.tolist())
+
+    def items(self):
+        '''(pair, Gb/s) of every demand, read straight off the arrays'''
+        return zip(self, (self.demands.traffic * self.share).tolist())
+
+    def __len__(self):
+        return len(self.demands)
+
+    def traffic(self):
+        return self.demands.traffic * self.share
+
+
+def iter_demand_matrix(G, deletion_percent=0.2, seed=0, chunk_pairs=1 << 20):
+    '''DemandMatrix chunks of about chunk_pairs node pairs, over whole blocks of source nodes
+
+    Pairs come in the order of generate_demands, and pair k always uses draws 2k and 2k + 1 of the generator,
+    so the demands are the same whatever the chunk size.
+    '''
+    node_ids = np.array(list(G.nodes()))
+    if node_ids.dtype.kind in 'iu' and len(node_ids):
+        # smallest integer type holding the node ids
+        node_ids = node_ids.astype(np.result_type(np.min_scalar_type(node_ids.min()),
+                                                  np.min_scalar_type(node_ids.max())))
+    num_nodes = len(node_ids)
+    rng = np.random.default_rng(seed)
+    traffic_Gbit = np.array(traffic_classes, dtype=np.uint16)
+    rows_per_chunk = max(num_nodes, 1) if chunk_pairs is None else max(1, chunk_pairs // max(num_nodes, 1))
+
+    for first_row in range(0, num_nodes, rows_per_chunk):
+        src = node_ids[first_row:first_row + rows_per_chunk]
+        # the (src, dst) pairs with src_id < dst_id of this block, row by row
+        src_index, dst_index = np.nonzero(src[:, None] < node_ids[None, :])
+
+        draws = rng.random((len(src_index), 2))
+        kept = draws[:, 0] > deletion_percent
+        choice = np.minimum((draws[kept, 1] * len(traffic_Gbit)).astype(np.intp), len(traffic_Gbit) - 1)
+        yield DemandMatrix(src[src_index[kept]], node_ids[dst_index[kept]], traffic_Gbit[choice])
+
+
+def generate_demand_matrix(G, deletion_percent=0.2, seed=0):
+    '''vectorized counterpart of generate_demands, drawn from a seeded NumPy generator'''
+    chunks = list(iter_demand_matrix(G, deletion_percent, seed, chunk_pairs=None))
+    if len(chunks) == 1:
+        return chunks[0]
+    return DemandMatrix(*(np.concatenate([getattr(chunk, name) for chunk in chunks])
+                          for name in ('src', 'dst', 'traffic')))
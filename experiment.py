@@ -0,0 +1,157 @@
+import argparse
+import csv
+import json
+import random
+import statistics
+
+from function import read_topology, clear_spectrum, generate_demands, set_priority, spectrum_occupation, \
+    k_shortest_path_first_fit_1_plus_1_RSA, k_shortest_path_first_fit_1_to_1_RSA, k_shortest_path_shared_protection, \
+    get_num_transponders, get_num_transponders_1_to_1, get_num_transponders_shared_protection, get_resource_ledger
+from path_cache import load_candidate_paths, map_in_workers
+from path_engine import compute_k_disjoint_paths
+from result_cache import ResultCache
+
+# {scheme: (RSA function, index of its traffic split in set_priority, transponder counter)}, every counter takes
+# (G, chosen paths, traffic dict) as the shared protection one needs the slots of each path
+schemes = {'1+1': (k_shortest_path_first_fit_1_plus_1_RSA, 0,
+                   lambda G, chosen_paths, traffic_dict: get_num_transponders(chosen_paths)),
+           '1:1': (k_shortest_path_first_fit_1_to_1_RSA, 1,
+                   lambda G, chosen_paths, traffic_dict: get_num_transponders_1_to_1(chosen_paths)),
+           'shared': (k_shortest_path_shared_protection, 2, get_num_transponders_shared_protection)}
+
+
+def _run_point(G, k_paths, point):
+    return run_point(G, k_paths, *point)
+
+
+def run_point(G, k_paths, seed, deletion_percent, scheme_names, num_slots=400, cache_dir=None):
+    '''metrics of all the schemes for one seed and load level, read from a ResultCache in cache_dir if given'''
+    # every point reseeds its own stream, so results do not depend on which worker runs it
+    random.seed(seed)
+    traffic_dict = generate_demands(G, deletion_percent)
+    traffic_splits = set_priority(traffic_dict)
+
+    record = {'seed': seed, 'deletion_percent': deletion_percent, 'num_demands': len(traffic_dict)}
+    cache = None if cache_dir is None else ResultCache(cache_dir)
+    for name in scheme_names:
+        RSA, split, count_transponders = schemes[name]
+        clear_spectrum(G, num_slots)
+        ledger = get_resource_ledger(G)
+        metrics = lambda chosen_paths: {'slots': spectrum_occupation(G),
+                                        'transponders': count_transponders(G, chosen_paths, traffic_splits[split]),
+                                        'overhead': ledger.protection_overhead(name)}
+        if cache is None:
+            values = metrics(RSA(G, k_paths, traffic_splits[split]))
+        else:
+            _, values, _ = cache.run(G, k_paths, traffic_splits[split], name, RSA, metrics, num_slots,
+                                     ('slots', 'transponders', 'overhead'))
+        for metric, value in values.items():
+            record[metric + '_' + name] = value
+    clear_spectrum(G, num_slots)
+
+    # savings of the other schemes against 1+1
+    if '1+1' in scheme_names:
+        for name in scheme_names:
+            if name == '1+1':
+                continue
+            for metric in ('slots', 'transponders'):
+                reference = record[metric + '_1+1']
+                saving = (reference - record[metric + '_' + name]) / reference if reference else None
+                record['saving_{}_{}'.format(metric, name)] = saving
+
+    return record
+
+
+def aggregate(records):
+    '''mean, standard deviation, min and max of every metric per load level'''
+    summary = {}
+    for record in records:
+        level = summary.setdefault(record['deletion_percent'], {})
+        for metric, value in record.items():
+            if metric in ('seed', 'deletion_percent') or value is None:
+                continue
+            level.setdefault(metric, []).append(value)
+
+    for deletion_percent, level in summary.items():
+        for metric, values in level.items():
+            level[metric] = {'mean': statistics.mean(values),
+                             'std': statistics.stdev(values) if len(values) > 1 else 0.0,
+                             'min': min(values),
+                             'max': max(values),
+                             'count': len(values)}
+    return summary
+
+
+def stream_records(results, results_filename=None):
+    '''collect the records, writing each one to the CSV file as soon as it is ready'''
+    records = []
+    if results_filename is None:
+        records.extend(results)
+        return records
+
+    with open(results_filename, 'w', newline='') as results_file:
+        writer = None
+        for record in results:
+            records.append(record)
+            if writer is None:
+                writer = csv.DictWriter(results_file, fieldnames=list(record))
+                writer.writeheader()
+            writer.writerow(record)
+            results_file.flush()
+    return records
+
+
+def run_experiment(G, k_paths, seeds, scheme_names=('1+1', '1:1', 'shared'), deletion_percents=(0.2,),
+                   num_slots=400, num_workers=1, results_filename=None, cache_dir=None):
+    '''run every (seed, load level) point, streaming one CSV row per point, and return the records and their summary
+
+    With a cache_dir, the RSA results of the points already run are read from a ResultCache there instead.
+    '''
+    if 'num_slots' not in G.graph:
+        G.graph['num_slots'] = num_slots
+    points = [(seed, deletion_percent, tuple(scheme_names), num_slots, cache_dir)
+              for deletion_percent in deletion_percents for seed in seeds]
+
+    # the topology and candidate paths go to every worker process once, read-only
+    results = map_in_workers(_run_point, (G, k_paths), points, num_workers, chunksize=max(1, len(points) // 64))
+    records = stream_records(results, results_filename)
+
+    summary = aggregate(records)
+    if results_filename:
+        with open(results_filename.rsplit('.', 1)[0] + '_summary.json', 'w') as f:
+            json.dump({str(level): metrics for level, metrics in summary.items()}, f, indent=2)
+
+    return records, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monte Carlo sweep of the protection schemes over seeds and loads')
+    parser.add_argument('--topology', default='IT_21.json')
+    parser.add_argument('--seeds', type=int, nargs=2, default=[42, 52], metavar=('FIRST', 'STOP'))
+    parser.add_argument('--schemes', nargs='+', default=list(schemes), choices=list(schemes))
+    parser.add_argument('--deletion-percents', type=float, nargs='+', default=[0.2])
+    parser.add_argument('--num-slots', type=int, default=400)
+    parser.add_argument('--num-candidate-paths', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, all cores by default')
+    parser.add_argument('--output', default='results.csv')
+    parser.add_argument('--cache-dir', default='rsa_cache', help='RSA result cache, reused across sweeps')
+    parser.add_argument('--no-cache', action='store_true', help='compute every point again')
+    args = parser.parse_args()
+
+    G = read_topology(args.topology)
+    G.graph['num_slots'] = args.num_slots
+    k_paths = load_candidate_paths(args.topology, G, compute_k_disjoint_paths,
+                                   num_candidate_paths=args.num_candidate_paths, num_workers=args.workers)
+
+    _, summary = run_experiment(G, k_paths, range(*args.seeds), args.schemes, args.deletion_percents,
+                                args.num_slots, args.workers, args.output,
+                                None if args.no_cache else args.cache_dir)
+
+    for deletion_percent, metrics in summary.items():
+        print('deletion_percent', deletion_percent)
+        for metric, stats in metrics.items():
+            print('  {}: {:.4f} +- {:.4f}'.format(metric, stats['mean'], stats['std']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import itertools
+
+import numpy as np
+
+from function import get_path_table
+from path_cache import map_in_workers
+from path_table import rounded_traffic
+
+
+def build_link_index(G, allocations):
+    '''{edge id: [(demand, position of the path in its allocation records)]} of every allocated path'''
+    store = G.graph['spectrum']
+    link_index = {}
+    for demand, records in allocations.items():
+        for position, (path, first_slot, num_slots, sharing_id) in enumerate(records):
+            for edge_id in store.path_edge_ids(path).tolist():
+                link_index.setdefault(edge_id, []).append((demand, position))
+    return link_index
+
+
+def single_link_scenarios(G):
+    '''one scenario per link, as tuples of edge ids'''
+    return [(edge_id,) for edge_id in range(G.number_of_edges())]
+
+
+def double_link_scenarios(G):
+    return list(itertools.combinations(range(G.number_of_edges()), 2))
+
+
+def srlg_scenarios(G, groups):
+    '''scenarios of shared risk link groups given as lists of links (u, v)'''
+    edge_index = G.graph['spectrum'].edge_index
+    return [tuple(sorted({edge_index[link] for link in group})) for group in groups]
+
+
+def hit_demands(allocations, link_index, failed_edge_ids):
+    '''({demand: positions of its paths on a failed link}, demands with all their paths on a failed link)'''
+    hit_paths = {}
+    for edge_id in failed_edge_ids:
+        for demand, position in link_index.get(edge_id, ()):
+            hit_paths.setdefault(demand, set()).add(position)
+    lost = [demand for demand, hit in hit_paths.items() if len(hit) == len(allocations[demand])]
+    return hit_paths, lost
+
+
+def evaluate_scenario(G, k_paths, traffic_dict, allocations, link_index, failed_edge_ids, restore=True):
+    '''impact of one failure scenario on the allocated demands, and how many of the lost ones can be restored
+
+    Only the demands on the failed links are visited. A demand is lost when all of its paths cross a failed link;
+    restoration re-routes lost demands in traffic_dict order over candidates avoiding the failed links, on a copy
+    of the spectrum where their own working spectrum is freed.
+    '''
+    hit_paths, lost = hit_demands(allocations, link_index, failed_edge_ids)
+    primary_hit = sum(1 for hit in hit_paths.values() if 0 in hit)
+
+    result = {'failed_edge_ids': tuple(failed_edge_ids),
+              'affected': len(hit_paths),
+              'primary_hit': primary_hit,
+              'switched_to_backup': primary_hit - sum(1 for demand in lost if 0 in hit_paths[demand]),
+              'lost': len(lost),
+              'restored': 0}
+    if not restore or not lost:
+        return result
+
+    store = G.graph['spectrum'].copy()
+    path_table = get_path_table(G, k_paths)
+    failed_links = np.zeros(G.number_of_edges(), dtype=bool)
+    failed_links[list(failed_edge_ids)] = True
+
+    # shared backup cells may still protect other demands, only dedicated spectrum is freed
+    for demand in lost:
+        for path, first_slot, num_slots, sharing_id in allocations[demand]:
+            if sharing_id is None:
+                store.release(store.path_edge_ids(path), first_slot, num_slots)
+
+    lost = set(lost)
+    for demand in traffic_dict:
+        if demand not in lost:
+            continue
+        traffic_G = rounded_traffic(traffic_dict[demand])
+
+        for row in path_table.rows(*demand):
+            edge_ids = path_table.path_edge_ids(row)
+            if failed_links[edge_ids].any():
+                continue
+            num_slots = path_table.slots(row, traffic_G)
+            first_slot = store.first_fit(edge_ids, num_slots)
+            if first_slot is not None:
+                store.occupy(edge_ids, first_slot, num_slots)
+                result['restored'] += 1
+                break
+
+    return result
+
+
+def _evaluate(G, k_paths, traffic_dict, allocations, link_index, restore, failed_edge_ids):
+    return evaluate_scenario(G, k_paths, traffic_dict, allocations, link_index, failed_edge_ids, restore)
+
+
+def failure_matrix(G, k_paths, traffic_dict, allocations, scenarios=None, restore=True, num_workers=1):
+    '''evaluate_scenario over all the scenarios, single link failures by default, spread across processes'''
+    if scenarios is None:
+        scenarios = single_link_scenarios(G)
+    link_index = build_link_index(G, allocations)
+    get_path_table(G, k_paths)
+
+    return list(map_in_workers(_evaluate, (G, k_paths, traffic_dict, allocations, link_index, restore), scenarios,
+                               num_workers, chunksize=max(1, len(scenarios) // 64)))
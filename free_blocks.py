@@ -0,0 +1,391 @@
+import heapq
+import math
+
+import numpy as np
+
+
+def row_blocks(row):
+    '''[start, end) runs of zeros in an occupation row'''
+    edges = np.flatnonzero(np.diff(np.concatenate(([1], row != 0, [1])).astype(np.int8)))
+    return zip(edges[::2].tolist(), edges[1::2].tolist())
+
+
+def build_slot_trees(slots):
+    '''(free prefix, free suffix, longest free block) of every node of a slot tree per link, as lists
+
+    Node 1 covers all the slots, node i has children 2i and 2i + 1, and the leaves start at the smallest power of two
+    holding a row; the padding leaves count as occupied. Levels are built for all the links at once.
+    '''
+    num_links, num_slots = slots.shape
+    size = 1 << max(num_slots - 1, 0).bit_length()
+    pre = np.zeros((num_links, 2 * size), dtype=np.int32)
+    pre[:, size:size + num_slots] = slots == 0
+    suf = pre.copy()
+    best = pre.copy()
+
+    half = 1
+    level = size // 2
+    while level:
+        nodes = slice(level, 2 * level)
+        left, right = slice(2 * level, 4 * level, 2), slice(2 * level + 1, 4 * level, 2)
+        pre[:, nodes] = np.where(pre[:, left] < half, pre[:, left], half + pre[:, right])
+        suf[:, nodes] = np.where(suf[:, right] < half, suf[:, right], half + suf[:, left])
+        best[:, nodes] = np.maximum(np.maximum(best[:, left], best[:, right]), suf[:, left] + pre[:, right])
+        half *= 2
+        level //= 2
+    return size, pre.tolist(), suf.tolist(), best.tolist()
+
+
+class LinkBlocks:
+    '''free slot blocks [start, end) of one link, in a slot tree augmented with the longest free block of every node
+
+    First fit descends the tree in O(log slots). Occupy and release update the leaves they cover and their ancestors,
+    and look the blocks they split or merge up in the tree, so they cost O(slots changed + log slots) per block
+    touched. The blocks are also counted by length in a Fenwick tree, with the starts of every length in a heap,
+    which makes best and exact fit O(log slots) too.
+    '''
+
+    __slots__ = ('num_slots', 'size', 'pre', 'suf', 'best', 'blocks', 'length_count', 'length_starts', 'free',
+                 'length_log_length')
+
+    def __init__(self, num_slots, size, pre, suf, best, blocks=()):
+        self.num_slots = num_slots
+        self.size = size
+        self.pre = pre
+        self.suf = suf
+        self.best = best
+        # {start: end} of the free blocks
+        self.blocks = {}
+        # Fenwick tree over block lengths 1 ... num_slots and {length: heap of block starts, stale ones dropped lazily}
+        self.length_count = [0] * (num_slots + 1)
+        self.length_starts = {}
+        self.free = 0
+        self.length_log_length = 0.0
+        for start, end in blocks:
+            self._add_block(start, end)
+
+    # slot tree
+
+    def _node_span(self, node):
+        '''(first slot, number of slots) of a tree node'''
+        length = self.size >> (node.bit_length() - 1)
+        return (node - (self.size // length)) * length, length
+
+    def _set(self, first, last, free):
+        value = 1 if free else 0
+        pre, suf, best = self.pre, self.suf, self.best
+        lo, hi = self.size + first, self.size + last
+        for leaf in range(lo, hi):
+            pre[leaf] = suf[leaf] = best[leaf] = value
+        # recombine the ancestors level by level, half is the number of slots under a child
+        lo, hi, half = lo >> 1, (hi - 1) >> 1, 1
+        while lo:
+            for node in range(lo, hi + 1):
+                left, right = 2 * node, 2 * node + 1
+                pre_left, suf_right = pre[left], suf[right]
+                pre[node] = pre_left if pre_left < half else half + pre[right]
+                suf[node] = suf_right if suf_right < half else half + suf[left]
+                best[node] = max(best[left], best[right], suf[left] + pre[right])
+            lo >>= 1
+            hi >>= 1
+            half *= 2
+
+    def first_fit_from(self, first, num_slots):
+        '''lowest start from slot first on of num_slots free slots, None if there is none'''
+        pre, suf, best = self.pre, self.suf, self.best
+        if num_slots <= 0:
+            return first if first <= self.num_slots else None
+        if first >= self.num_slots or best[1] < num_slots:
+            return None
+        # climb from the leaf of slot first, visiting the nodes covering [first, size) left to right; the padding
+        # leaves are occupied, so runs never reach past num_slots. run counts the free slots running into the node
+        run = 0
+        node, end, length = first + self.size, 2 * self.size, 1
+        while node < end:
+            if node & 1:
+                start = node * length - self.size
+                if run + pre[node] >= num_slots:
+                    return start - run
+                if best[node] >= num_slots:
+                    # the block lies inside the node, descend to its leftmost one
+                    while node < self.size:
+                        left, right = 2 * node, 2 * node + 1
+                        if best[left] >= num_slots:
+                            node = left
+                        elif suf[left] + pre[right] >= num_slots:
+                            return self._node_span(right)[0] - suf[left]
+                        else:
+                            node = right
+                    return node - self.size
+                run = run + length if pre[node] == length else suf[node]
+                node += 1
+            node >>= 1
+            end >>= 1
+            length *= 2
+        return None
+
+    def first_fit(self, num_slots):
+        return self.first_fit_from(0, num_slots)
+
+    def free_run(self, slot):
+        '''number of free slots from slot on'''
+        pre = self.pre
+        run = 0
+        node, end, length = slot + self.size, 2 * self.size, 1
+        while node < end:
+            if node & 1:
+                if pre[node] < length:
+                    return run + pre[node]
+                run += length
+                node += 1
+            node >>= 1
+            end >>= 1
+            length *= 2
+        return run
+
+    def free_run_before(self, slot):
+        '''number of free slots ending right before slot'''
+        suf = self.suf
+        run = 0
+        begin, node, length = self.size, slot + self.size, 1
+        while begin < node:
+            if node & 1:
+                node -= 1
+                if suf[node] < length:
+                    return run + suf[node]
+                run += length
+            begin >>= 1
+            node >>= 1
+            length *= 2
+        return run
+
+    def blocks_touching(self, first, last):
+        '''[start, end) of the free blocks overlapping slots [first, last), in slot order'''
+        slot = self.first_fit_from(first, 1)
+        touching = []
+        while slot is not None and slot < last:
+            start = slot - self.free_run_before(slot)
+            end = slot + self.free_run(slot)
+            touching.append((start, end))
+            slot = self.first_fit_from(end, 1)
+        return touching
+
+    # blocks by length
+
+    def _count(self, length, delta):
+        counts = self.length_count
+        while length <= self.num_slots:
+            counts[length] += delta
+            length += length & -length
+
+    def _add_block(self, start, end):
+        length = end - start
+        self.blocks[start] = end
+        self._count(length, 1)
+        starts = self.length_starts.setdefault(length, [])
+        heapq.heappush(starts, start)
+        self.free += length
+        self.length_log_length += length * math.log(length)
+
+    def _remove_block(self, start):
+        length = self.blocks.pop(start) - start
+        self._count(length, -1)
+        self.free -= length
+        self.length_log_length -= length * math.log(length)
+
+    def _lowest_start(self, length):
+        '''lowest start among the free blocks of a length, dropping the heap entries of blocks gone since'''
+        starts = self.length_starts[length]
+        while self.blocks.get(starts[0]) != starts[0] + length:
+            heapq.heappop(starts)
+        if len(starts) > 64 and len(starts) > 4 * self.num_of_length(length):
+            starts[:] = [start for start in starts if self.blocks.get(start) == start + length]
+            heapq.heapify(starts)
+        return starts[0]
+
+    def num_of_length(self, length):
+        return self.blocks_up_to(length) - self.blocks_up_to(length - 1)
+
+    def blocks_up_to(self, length):
+        '''number of free blocks no longer than length'''
+        total = 0
+        length = min(length, self.num_slots)
+        while length > 0:
+            total += self.length_count[length]
+            length -= length & -length
+        return total
+
+    def _shortest_from(self, num_slots):
+        '''shortest length of a free block holding num_slots, None if none does'''
+        # Fenwick descent to the first length whose running count passes the blocks shorter than num_slots
+        target = self.blocks_up_to(num_slots - 1) + 1
+        if target > len(self.blocks):
+            return None
+        length = 0
+        step = 1 << self.num_slots.bit_length()
+        while step:
+            if length + step <= self.num_slots and self.length_count[length + step] < target:
+                length += step
+                target -= self.length_count[length]
+            step >>= 1
+        return length + 1
+
+    # updates
+
+    def occupy(self, first, last):
+        '''split the blocks overlapping slots [first, last)'''
+        touching = self.blocks_touching(first, last)
+        if not touching:
+            return
+        self._set(first, last, False)
+        for start, end in touching:
+            self._remove_block(start)
+            if start < first:
+                self._add_block(start, first)
+            if end > last:
+                self._add_block(last, end)
+
+    def release(self, first, last):
+        '''add slots [first, last) as free, merged with the blocks they touch'''
+        if last <= first:
+            return
+        for start, _ in self.blocks_touching(max(first - 1, 0), min(last + 1, self.num_slots)):
+            self._remove_block(start)
+        self._set(first, last, True)
+        start = first - self.free_run_before(first)
+        self._add_block(start, first + self.free_run(first))
+
+    # queries
+
+    def best_fit(self, num_slots):
+        '''start of the smallest block holding num_slots, the lowest one among equals'''
+        length = self._shortest_from(max(num_slots, 1))
+        return None if length is None else self._lowest_start(length)
+
+    def exact_fit(self, num_slots):
+        if num_slots < 1 or num_slots > self.num_slots or not self.num_of_length(num_slots):
+            return None
+        return self._lowest_start(num_slots)
+
+    def largest(self):
+        return self.best[1]
+
+    def entropy(self):
+        '''Shannon entropy of the free block sizes, 0 for unfragmented spectrum'''
+        if not self.free:
+            return 0.0
+        return max(math.log(self.free) - self.length_log_length / self.free, 0.0)
+
+    def external_fragmentation(self):
+        '''share of the free slots outside the largest free block'''
+        return 1 - self.largest() / self.free if self.free else 0.0
+
+
+class FreeBlockIndex:
+    '''free spectrum blocks of every link, kept in step with a SpectrumStore by its occupy and release calls
+
+    Fits on one link descend its slot tree in O(log slots). First fit on a path leapfrogs over its links: each link
+    answers the lowest start from the current candidate slot on, until all of them agree. Best and exact fit on a path
+    walk the blocks free on all its links, found the same way.
+    '''
+
+    __slots__ = ('num_slots', 'links')
+
+    def __init__(self, slots):
+        self.num_slots = slots.shape[1]
+        size, pre, suf, best = build_slot_trees(slots)
+        self.links = [LinkBlocks(self.num_slots, size, *trees, row_blocks(row))
+                      for row, trees in zip(slots, zip(pre, suf, best))]
+
+    def occupy(self, edge_ids, first_slot, num_slots):
+        for edge_id in np.asarray(edge_ids).tolist():
+            self.links[edge_id].occupy(first_slot, first_slot + num_slots)
+
+    def release(self, edge_ids, first_slot, num_slots):
+        for edge_id in np.asarray(edge_ids).tolist():
+            self.links[edge_id].release(first_slot, first_slot + num_slots)
+
+    def release_cells(self, edge_ids, slots):
+        for edge_id, slot in zip(np.asarray(edge_ids).tolist(), np.asarray(slots).tolist()):
+            self.links[edge_id].release(slot, slot + 1)
+
+    def clear(self):
+        self.__init__(np.zeros((len(self.links), self.num_slots), dtype=np.uint8))
+
+    def _first_fit_from(self, links, first, num_slots):
+        start = first
+        agreed = 0
+        while agreed < len(links):
+            for link in links:
+                slot = link.first_fit_from(start, num_slots)
+                if slot is None:
+                    return None
+                if slot == start:
+                    agreed += 1
+                else:
+                    start = slot
+                    agreed = 1
+                if agreed == len(links):
+                    break
+        return start
+
+    def path_blocks(self, edge_ids):
+        '''generator of the [start, end) blocks free on every link of a path, in slot order'''
+        links = [self.links[edge_id] for edge_id in np.asarray(edge_ids).tolist()]
+        if not links:
+            yield 0, self.num_slots
+            return
+        slot = self._first_fit_from(links, 0, 1)
+        while slot is not None:
+            end = slot + min(link.free_run(slot) for link in links)
+            yield slot, end
+            slot = self._first_fit_from(links, end, 1)
+
+    def _fits(self, links, num_slots):
+        # no path block is longer than the largest free block of any of its links
+        return all(link.largest() >= num_slots for link in links)
+
+    def first_fit(self, edge_ids, num_slots):
+        links = [self.links[edge_id] for edge_id in np.asarray(edge_ids).tolist()]
+        if len(links) == 1:
+            return links[0].first_fit(num_slots)
+        if not self._fits(links, num_slots):
+            return None
+        return self._first_fit_from(links, 0, num_slots)
+
+    def best_fit(self, edge_ids, num_slots):
+        links = [self.links[edge_id] for edge_id in np.asarray(edge_ids).tolist()]
+        if len(links) == 1:
+            return links[0].best_fit(num_slots)
+        if not self._fits(links, num_slots):
+            return None
+        fitting = [(end - start, start) for start, end in self.path_blocks(edge_ids) if end - start >= num_slots]
+        return min(fitting)[1] if fitting else None
+
+    def exact_fit(self, edge_ids, num_slots):
+        links = [self.links[edge_id] for edge_id in np.asarray(edge_ids).tolist()]
+        if len(links) == 1:
+            return links[0].exact_fit(num_slots)
+        if not self._fits(links, num_slots):
+            return None
+        for start, end in self.path_blocks(edge_ids):
+            if end - start == num_slots:
+                return start
+        return None
+
+    def fragmentation(self, edge_id):
+        link = self.links[edge_id]
+        return {'free_slots': link.free,
+                'free_blocks': len(link.blocks),
+                'largest_free_block': link.largest(),
+                'entropy': link.entropy(),
+                'external_fragmentation': link.external_fragmentation()}
+
+    def summary(self):
+        '''fragmentation averaged over the links'''
+        num_links = max(len(self.links), 1)
+        return {'free_slots': sum(link.free for link in self.links),
+                'largest_free_block': max((link.largest() for link in self.links), default=0),
+                'mean_free_blocks': sum(len(link.blocks) for link in self.links) / num_links,
+                'mean_entropy': sum(link.entropy() for link in self.links) / num_links,
+                'mean_external_fragmentation': sum(link.external_fragmentation() for link in self.links) / num_links}
@@ -2,6 +2,18 @@ import networkx as nx
 import json
 import random
 import math
+import os
+
+import numpy as np
+
+import instrumentation
+from candidate_provider import LazyCandidatePaths
+from instrumentation import timed
+from path_cache import compute_paths_per_source
+from path_table import MF_num_slots, PathTable, rounded_traffic
+from resource_ledger import ResourceLedger
+from shared_protection import BackupSharing, cheapest_backup, path_bitset
+from spectrum import SpectrumStore
 
 
 def read_topology(filename):
@@ -48,103 +60,204 @@ def set_priority(traffic_dict):
 
 def clear_spectrum(G, num_slots=400):
     # occupation of all the channels of all the links is initially zero
+    store = G.graph.get('spectrum')
+    ledger = G.graph.get('resource_ledger')
+    if store is None or store.num_slots != num_slots or store.slots.shape[0] != G.number_of_edges():
+        store = SpectrumStore(G, num_slots)
+        set_spectrum(G, store, ledger=None if ledger is None else ResourceLedger(store))
+    else:
+        store.clear()
+        if ledger is not None:
+            ledger.clear()
+
+    # the backup sharing ledger describes the spectrum just cleared
+    G.graph.pop('backup_sharing', None)
+
+
+def set_spectrum(G, store, sharing=None, ledger=None):
+    '''make store the spectrum of G, with its backup sharing and resource ledgers if there are some'''
+    G.graph['spectrum'] = store
+
+    # each link keeps a view on its own row of the shared array
     for link in G.edges:
-        G.edges[link]['spectrum_slots'] = [0] * num_slots
+        G.edges[link]['spectrum_slots'] = store.link_slots(link)
+
+    if sharing is None:
+        G.graph.pop('backup_sharing', None)
+    else:
+        G.graph['backup_sharing'] = sharing
+    if ledger is None:
+        G.graph.pop('resource_ledger', None)
+    else:
+        G.graph['resource_ledger'] = ledger
+
 
-def compute_k_edge_disjoint_paths(G, num_candidate_paths=10):
+def snapshot_spectrum(G):
+    '''checkpoint of the spectrum and backup sharing state, cheap enough to take before every what-if run'''
+    store = G.graph['spectrum']
+    sharing = G.graph.get('backup_sharing')
+    ledger = G.graph.get('resource_ledger')
+    return store.snapshot(), None if sharing is None else sharing.copy(store), \
+        None if ledger is None else ledger.copy(store)
+
+
+def restore_spectrum(G, snapshot):
+    '''go back to a snapshot_spectrum checkpoint, the snapshot stays valid for later restores'''
+    store_snapshot, sharing, ledger = snapshot
+    store = G.graph['spectrum']
+    store.restore(store_snapshot)
+    if sharing is None:
+        G.graph.pop('backup_sharing', None)
+    else:
+        G.graph['backup_sharing'] = sharing.copy(store)
+    if ledger is None:
+        G.graph.pop('resource_ledger', None)
+    else:
+        G.graph['resource_ledger'] = ledger.copy(store)
+
+
+def fork_spectrum(G, checkpoint=None):
+    '''copy of G with its own spectrum, taken from G or opened copy-on-write from a save_checkpoint file
+
+    The topology, candidate paths and path table are shared with G, only the spectrum state is separate.
+    '''
+    store = G.graph['spectrum']
+    sharing = G.graph.get('backup_sharing')
+    ledger = G.graph.get('resource_ledger')
+    if checkpoint is None:
+        fork_store = store.copy()
+        fork_sharing = None if sharing is None else sharing.copy(fork_store)
+        fork_ledger = None if ledger is None else ledger.copy(fork_store)
+    else:
+        fork_store = store.open_checkpoint(checkpoint + '.npy', mode='c')
+        fork_sharing = BackupSharing.load(checkpoint + '.sharing', fork_store) \
+            if os.path.exists(checkpoint + '.sharing') else None
+        fork_ledger = ResourceLedger.load(checkpoint + '.ledger', fork_store) \
+            if os.path.exists(checkpoint + '.ledger') else None
+
+    fork = G.copy()
+    set_spectrum(fork, fork_store, fork_sharing, fork_ledger)
+    return fork
+
+
+def save_checkpoint(G, checkpoint):
+    '''write the spectrum of G to checkpoint.npy, and its ledgers to checkpoint.sharing and checkpoint.ledger'''
+    G.graph['spectrum'].save_checkpoint(checkpoint + '.npy')
+    for suffix, name in (('.sharing', 'backup_sharing'), ('.ledger', 'resource_ledger')):
+        state = G.graph.get(name)
+        if state is not None:
+            state.save(checkpoint + suffix)
+        elif os.path.exists(checkpoint + suffix):
+            os.remove(checkpoint + suffix)
+
+def k_edge_disjoint_paths_from(G, src_id, num_candidate_paths=10, dst_ids=None):
+    '''primary and edge-disjoint backup paths from src_id to every node with a higher id'''
     k_paths_dict = {}
 
-    for src_id in G.nodes():
-        for dst_id in G.nodes():
-            if src_id >= dst_id:
-                continue
+    for dst_id in G.nodes():
+        if src_id >= dst_id or (dst_ids is not None and dst_id not in dst_ids):
+            continue
 
-            # Compute primary path
-            primary_path = nx.shortest_path(G, source=src_id, target=dst_id, weight='length')
+        # Compute primary path
+        primary_path = nx.shortest_path(G, source=src_id, target=dst_id, weight='length')
 
-            # Compute backup paths
-            backup_paths = []
-            path_generator = nx.edge_disjoint_paths(G, src_id, dst_id)
+        # Compute backup paths
+        backup_paths = []
+        path_generator = nx.edge_disjoint_paths(G, src_id, dst_id)
 
-            for path in path_generator:
-                if set(path) != set(primary_path):
-                    backup_paths.append(path)
-                    if len(backup_paths) == num_candidate_paths:
-                        break
+        for path in path_generator:
+            if set(path) != set(primary_path):
+                backup_paths.append(path)
+                if len(backup_paths) == num_candidate_paths:
+                    break
 
-            k_paths_dict[(src_id, dst_id)] = [primary_path] + backup_paths
+        k_paths_dict[(src_id, dst_id)] = [primary_path] + backup_paths
 
     return k_paths_dict
 
 
+def compute_k_edge_disjoint_paths(G, num_candidate_paths=10, num_workers=1):
+    return compute_paths_per_source(G, k_edge_disjoint_paths_from, num_candidate_paths, num_workers)
+
+
+@timed('choose_MF')
 def choose_MF(G, path, traffic_G):
     '''choose modulation format with lowest spectrum occupation based on path traffic request'''
 
-    # {traffic_request_Gbit/s: [(maximum_r  each, number_of_slots)]}
-    MF_option = {100: [(4500, 6), (3500, 4), (3000, 3), (2500, 2), (1500, 2)],
-                 200: [(2500, 8), (1500, 6), (1000, 5), (700, 4), (500, 3)],
-                 300: [(2000, 10), (1500, 8), (1000, 7), (800, 6), (500, 4)],
-                 400: [(2000, 16), (1000, 12), (800, 8), (600, 6), (200, 5)],
-                 500: [(1500, 20), (800, 16), (600, 12), (500, 8), (200, 7)],
-                 600: [(1000, 28), (700, 22), (500, 20), (400, 16), (200, 10)],
-                 700: [(1000, 32), (600, 26), (400, 24), (300, 20), (200, 14)],
-                 800: [(800, 36), (500, 32), (300, 28), (250, 24), (200, 18)],
-                 900: [(600, 42), (400, 36), (250, 32), (200, 28), (100, 24)],
-                 1000: [(500, 48), (300, 42), (200, 38), (150, 32), (100, 24)]}
+    # candidate paths come straight from the precomputed table
+    path_table = G.graph.get('path_table')
+    if path_table is not None:
+        row = path_table.find(path)
+        if row is not None:
+            return path_table.slots(row, traffic_G)
 
     path_length = 0
     for link in zip(path, path[1:]):
         path_length += G.edges[link]['length']
 
-    min_slots = 1e6
+    return MF_num_slots(path_length, traffic_G)
 
-    # choose option with lowest number of slots with reach higher than path length
-    for max_reach, num_slots in MF_option[traffic_G]:
-        if path_length <= max_reach and num_slots < min_slots:
-            min_slots = num_slots
 
-    # return default value of 1 if no valid modulation format option was found
-    if min_slots == 1e6:
-        return 1
-    else:
-        return int(min_slots)
+def get_path_table(G, k_SP_dict):
+    '''PathTable of the candidate paths, built once per candidate dict and kept on the graph'''
+    path_table = G.graph.get('path_table')
+    if path_table is None or path_table.k_paths is not k_SP_dict:
+        # a LazyCandidatePaths is its own path table
+        path_table = k_SP_dict if isinstance(k_SP_dict, LazyCandidatePaths) else PathTable(G, k_SP_dict)
+        G.graph['path_table'] = path_table
+    return path_table
 
 
-def First_Fit(G, path, num_slots):
+@timed('First_Fit')
+def First_Fit(G, path, num_slots, edge_ids=None):
     # check if the graph has a num_slots attribute
     if 'num_slots' not in G.graph:
         raise ValueError("The graph must have a 'num_slots' attribute.")
-
-    slots_in_band = G.graph["num_slots"]
-    reserved_slots = [False] * slots_in_band
-
-    # calculate the number of slots required for primary and backup paths
-    num_slots_req = num_slots * 2
-
-    for slot in range(slots_in_band - num_slots_req + 1):
-        # check if the slots are available for both primary and backup paths
-        backup_path_start = slot + num_slots
-        backup_path_end = slot + num_slots_req
-        if all(not reserved_slots[i] for i in range(slot, backup_path_start)) and all(
-                not reserved_slots[i] for i in range(backup_path_start, backup_path_end)):
-            # mark the slots as reserved for both primary and backup paths
-            for i in range(slot, backup_path_end):
-                reserved_slots[i] = True
-            return slot
-
-    return None
-
-def occupy_spectrum(G, path, first_slot, num_slots):
-    for link in zip(path, path[1:]):
-        for slot_shift in range(num_slots):
-            G.edges[link]['spectrum_slots'][first_slot + slot_shift] = 1
+    if 'spectrum' not in G.graph:
+        raise ValueError("The graph spectrum must be initialised with clear_spectrum.")
+
+    # first block of num_slots contiguous slots free on every link of the path
+    store = G.graph['spectrum']
+    if edge_ids is None:
+        edge_ids = store.path_edge_ids(path)
+    if instrumentation.active is not None:
+        instrumentation.active.count('first_fit_paths')
+        instrumentation.active.count('slots_scanned', len(edge_ids) * store.num_slots)
+    return store.first_fit(edge_ids, num_slots)
+
+
+@timed('First_Fit')
+def First_Fit_k_paths(G, paths, num_slots_list, edge_ids_list=None):
+    '''First-Fit over all the candidate paths of a demand at once, None for the paths without room'''
+    if 'spectrum' not in G.graph:
+        raise ValueError("The graph spectrum must be initialised with clear_spectrum.")
+
+    store = G.graph['spectrum']
+    if edge_ids_list is None:
+        edge_ids_list = [store.path_edge_ids(path) for path in paths]
+    if instrumentation.active is not None:
+        instrumentation.active.count('first_fit_paths', len(edge_ids_list))
+        instrumentation.active.count('slots_scanned', sum(map(len, edge_ids_list)) * store.num_slots)
+    first_slots = store.first_fit_paths(edge_ids_list, num_slots_list)
+    return [int(slot) if slot >= 0 else None for slot in first_slots]
+
+@timed('occupy_spectrum')
+def occupy_spectrum(G, path, first_slot, num_slots, edge_ids=None):
+    store = G.graph['spectrum']
+    if edge_ids is None:
+        edge_ids = store.path_edge_ids(path)
+    store.occupy(edge_ids, first_slot, num_slots)
 
 def spectrum_occupation(G):
-    num_slots_occupied = 0
-    for link in G.edges:
-        num_slots_occupied += sum(G.edges[link]['spectrum_slots'])
+    return G.graph['spectrum'].occupation()
 
-    return num_slots_occupied
+def index_free_blocks(G):
+    '''keep a free block index on the spectrum of G, for tree based first fit and fragmentation metrics'''
+    return G.graph['spectrum'].index_free_blocks()
+
+def spectrum_fragmentation(G):
+    '''fragmentation of the free spectrum averaged over the links, from the free block index'''
+    return index_free_blocks(G).summary()
 
 def get_num_transponders(chosen_paths):
     num_transponders = 0
@@ -169,13 +282,12 @@ def get_num_transponders_1_to_1(one_to_one):
 def get_num_transponders_shared_protection(G, chosen_paths, traffic_dict):
     num_transponders = 0
     for demand_id, (src_id, dst_id) in enumerate(traffic_dict.keys()):
-        traffic_G = traffic_dict[(src_id, dst_id)]
-        if traffic_G < 50:
-            traffic_G = 100
-        else:
-            traffic_G = round(traffic_G, -2)
+        traffic_G = rounded_traffic(traffic_dict[(src_id, dst_id)])
         primary_path, backup_path = chosen_paths[(src_id, dst_id)]
 
+        if primary_path == -1:
+            # blocked demands hold no transponder
+            continue
         if backup_path is None:
             num_slots_primary = choose_MF(G, primary_path, traffic_G)
             num_transponders += math.ceil(num_slots_primary / 2)
@@ -186,199 +298,256 @@ def get_num_transponders_shared_protection(G, chosen_paths, traffic_dict):
 
     return num_transponders
 
+@timed('is_path_available')
 def is_path_available(G, path, first_slot, num_slots):
-    spectrum_available = G.graph.get('spectrum_available', {})
-    for i in range(len(path)):
-        if i == len(path) - 1:
-            continue
-        edge = (path[i], path[i+1])
-        if edge not in spectrum_available:
-            return False
-        for slot in range(first_slot, first_slot + num_slots):
-            if slot not in spectrum_available[edge]:
-                return False
-        for adjacent_edge in G.edges(path[i]):
-            if adjacent_edge == edge or adjacent_edge == (path[i+1], path[i]):
-                continue
-            if adjacent_edge not in spectrum_available:
-                return False
-            for slot in range(first_slot, first_slot + num_slots):
-                if slot not in spectrum_available[adjacent_edge]:
-                    return False
-    return True
-
-def release_spectrum(G, path, first_slot, num_slots):
-    for i in range(1, len(path)):
-        if 'spectrum_slots' in G[path[i-1]][path[i]]:
-            for slot in range(first_slot, first_slot + num_slots):
-                G[path[i-1]][path[i]]['spectrum_slots'][slot] = 0
+    '''whether the slots are free on every link of the path and on every other link leaving its nodes'''
+    store = G.graph['spectrum']
+    if len(path) < 2:
+        return True
+
+    # the links of the path leave its nodes too, so one check over all the adjacent links covers both
+    adjacent_edge_ids = np.concatenate([store.incident_edge_ids[node] for node in path[:-1]])
+    return store.is_free(adjacent_edge_ids, first_slot, num_slots)
+
+@timed('release_spectrum')
+def release_spectrum(G, path, first_slot, num_slots, edge_ids=None):
+    store = G.graph.get('spectrum')
+    if store is not None:
+        if edge_ids is None:
+            edge_ids = store.path_edge_ids(path)
+        store.release(edge_ids, first_slot, num_slots)
+
+
+def get_backup_sharing(G):
+    '''sharing ledger of the backup spectrum, created on first use after clear_spectrum'''
+    sharing = G.graph.get('backup_sharing')
+    if sharing is None:
+        sharing = BackupSharing(G.graph['spectrum'])
+        G.graph['backup_sharing'] = sharing
+    return sharing
+
+
+def get_resource_ledger(G):
+    '''resource ledger of the spectrum, created on first use and then kept up to date by the RSA functions'''
+    ledger = G.graph.get('resource_ledger')
+    if ledger is None:
+        ledger = ResourceLedger(G.graph['spectrum'])
+        G.graph['resource_ledger'] = ledger
+    return ledger
+
+
+def record_allocation(allocations, demand, path, first_slot, num_slots, sharing_id=None):
+    '''remember the spectrum a demand occupies, so that it can be released later'''
+    if allocations is not None:
+        allocations.setdefault(demand, []).append((path, first_slot, num_slots, sharing_id))
+
+
+def release_allocations(G, records, scheme=None):
+    '''give back the spectrum of the records of one demand, shared backups through their sharing ledger
+
+    The resource ledger, if any, is updated when the scheme that allocated the records is given.
+    '''
+    store = G.graph['spectrum']
+    ledger = G.graph.get('resource_ledger') if scheme is not None else None
+    for position, (path, first_slot, num_slots, sharing_id) in enumerate(records):
+        edge_ids = store.path_edge_ids(path)
+        if sharing_id is None:
+            release_spectrum(G, path, first_slot, num_slots, edge_ids)
+        else:
+            get_backup_sharing(G).release(sharing_id, edge_ids, first_slot, num_slots)
+        if ledger is not None:
+            # the first record of a demand is its working path
+            ledger.remove(scheme, 'primary' if position == 0 else 'backup', edge_ids, first_slot, num_slots)
 
 
-def k_shortest_path_first_fit_1_plus_1_RSA(G, k_SP_dict, traffic_dict):
+@timed('k_shortest_path_first_fit_1_plus_1_RSA')
+def k_shortest_path_first_fit_1_plus_1_RSA(G, k_SP_dict, traffic_dict, allocations=None):
     chosen_paths = {}
+    path_table = get_path_table(G, k_SP_dict)
+    stats = instrumentation.active
+    ledger = G.graph.get('resource_ledger')
 
     for demand_id, (src_id, dst_id) in enumerate(traffic_dict.keys()):
-        traffic_G = traffic_dict[(src_id, dst_id)]
-        if traffic_G < 50:
-            traffic_G = 100
-        else:
-            traffic_G = round(traffic_G, -2)
+        traffic_G = rounded_traffic(traffic_dict[(src_id, dst_id)])
 
-        k_paths = k_SP_dict[(src_id, dst_id)]
-        primary_path = k_paths[0]
-        backup_paths = k_paths[1:]
+        rows = path_table.rows(src_id, dst_id)
+        primary_row = rows[0]
+        primary_path = path_table.paths[primary_row]
+        primary_edge_ids = path_table.path_edge_ids(primary_row)
 
         # Allocate spectrum for primary path
-        num_slots = choose_MF(G, primary_path, traffic_G)
-        primary_first_slot = First_Fit(G, primary_path, num_slots)
-        occupy_spectrum(G, primary_path, primary_first_slot, num_slots)
+        num_slots = path_table.slots(primary_row, traffic_G)
+        primary_first_slot = First_Fit(G, primary_path, num_slots, primary_edge_ids)
+        if primary_first_slot is None:
+            # demand is blocked
+            if stats is not None:
+                stats.count('candidates_tried')
+                stats.count('blocked_demands')
+            chosen_paths[(src_id, dst_id)] = (-1, -1)
+            continue
+        if ledger is not None:
+            ledger.add('1+1', 'primary', primary_edge_ids, primary_first_slot, num_slots)
+        occupy_spectrum(G, primary_path, primary_first_slot, num_slots, primary_edge_ids)
+        record_allocation(allocations, (src_id, dst_id), primary_path, primary_first_slot, num_slots)
 
-        # Allocate spectrum for backup path
+        # Allocate spectrum for backup path, the first candidate with room wins
         backup_path = None
-        for path in backup_paths:
-            num_slots = choose_MF(G, path, traffic_G)
-            first_slot = First_Fit(G, path, num_slots)
-            if first_slot is not None:
-                backup_path = path
-                occupy_spectrum(G, backup_path, first_slot, num_slots)
+        backups_tried = 0
+        for backup_rows in path_table.row_batches(rows[1:]):
+            backup_paths = [path_table.paths[row] for row in backup_rows]
+            backup_edge_ids = [path_table.path_edge_ids(row) for row in backup_rows]
+            backup_num_slots = [path_table.slots(row, traffic_G) for row in backup_rows]
+            backup_first_slots = First_Fit_k_paths(G, backup_paths, backup_num_slots, backup_edge_ids)
+            for path, edge_ids, num_slots, first_slot in zip(backup_paths, backup_edge_ids, backup_num_slots,
+                                                             backup_first_slots):
+                backups_tried += 1
+                if first_slot is not None:
+                    backup_path = path
+                    if ledger is not None:
+                        ledger.add('1+1', 'backup', edge_ids, first_slot, num_slots)
+                    occupy_spectrum(G, backup_path, first_slot, num_slots, edge_ids)
+                    record_allocation(allocations, (src_id, dst_id), backup_path, first_slot, num_slots)
+                    break
+            if backup_path is not None:
                 break
 
+        if stats is not None:
+            stats.count('candidates_tried', 1 + backups_tried)
+            if backup_path is None:
+                stats.count('unprotected_demands')
+
         chosen_paths[(src_id, dst_id)] = (primary_path, backup_path)
 
     return chosen_paths
 
 
-def k_shortest_path_first_fit_1_to_1_RSA(G, k_SP_dict, traffic_dict):
+@timed('k_shortest_path_first_fit_1_to_1_RSA')
+def k_shortest_path_first_fit_1_to_1_RSA(G, k_SP_dict, traffic_dict, allocations=None):
     chosen_paths = {}
+    path_table = get_path_table(G, k_SP_dict)
+    stats = instrumentation.active
+    ledger = G.graph.get('resource_ledger')
 
     for demand_id, (src_id, dst_id) in enumerate(traffic_dict.keys()):
-        traffic_G = traffic_dict[(src_id, dst_id)]
-        if traffic_G < 50:
-            traffic_G = 100
-        else:
-            traffic_G = round(traffic_G, -2)
+        traffic_G = rounded_traffic(traffic_dict[(src_id, dst_id)])
 
-        k_paths = k_SP_dict[(src_id, dst_id)]
-        primary_path = k_paths[0]
+        rows = path_table.rows(src_id, dst_id)
+        primary_row = rows[0]
+        primary_path = path_table.paths[primary_row]
+        primary_edge_ids = path_table.path_edge_ids(primary_row)
         backup_path = None
 
-        # Allocate spectrum for primary path
-        num_slots = choose_MF(G, primary_path, traffic_G)
-        primary_first_slot = First_Fit(G, primary_path, num_slots)
-        occupy_spectrum(G, primary_path, primary_first_slot, num_slots)
+        # Allocate spectrum for primary path, checking its availability before it takes the slots
+        primary_num_slots = path_table.slots(primary_row, traffic_G)
+        primary_first_slot = First_Fit(G, primary_path, primary_num_slots, primary_edge_ids)
+        primary_available = primary_first_slot is not None and \
+            is_path_available(G, primary_path, primary_first_slot, primary_num_slots)
+        if primary_first_slot is not None:
+            if ledger is not None:
+                ledger.add('1:1', 'primary', primary_edge_ids, primary_first_slot, primary_num_slots)
+            occupy_spectrum(G, primary_path, primary_first_slot, primary_num_slots, primary_edge_ids)
 
         # Check if the primary path is available, if not, switch to backup path
-        if not is_path_available(G, primary_path, primary_first_slot, num_slots):
-            for path in k_paths[1:]:
+        if not primary_available:
+            backups_tried = 0
+            for row in rows[1:]:
+                backups_tried += 1
                 # Allocate spectrum for backup path
-                num_slots = choose_MF(G, path, traffic_G)
-                first_slot = First_Fit(G, path, num_slots)
-                if is_path_available(G, path, first_slot, num_slots):
+                path = path_table.paths[row]
+                edge_ids = path_table.path_edge_ids(row)
+                num_slots = path_table.slots(row, traffic_G)
+                first_slot = First_Fit(G, path, num_slots, edge_ids)
+                if first_slot is not None and is_path_available(G, path, first_slot, num_slots):
                     backup_path = path
-                    occupy_spectrum(G, backup_path, first_slot, num_slots)
+                    if ledger is not None:
+                        # the backup becomes the working path of the demand
+                        ledger.add('1:1', 'primary', edge_ids, first_slot, num_slots)
+                    occupy_spectrum(G, backup_path, first_slot, num_slots, edge_ids)
                     break
 
+            if stats is not None:
+                stats.count('candidates_tried', backups_tried)
+
             # Switch the traffic to the backup path
             if backup_path:
-                release_spectrum(G, primary_path, primary_first_slot, num_slots)
+                if stats is not None:
+                    stats.count('switchovers')
+                if primary_first_slot is not None:
+                    release_spectrum(G, primary_path, primary_first_slot, primary_num_slots, primary_edge_ids)
+                    if ledger is not None:
+                        ledger.remove('1:1', 'primary', primary_edge_ids, primary_first_slot, primary_num_slots)
                 primary_path = backup_path
                 primary_first_slot = first_slot
-                occupy_spectrum(G, primary_path, primary_first_slot, num_slots)
-
+                primary_num_slots = num_slots
+                occupy_spectrum(G, primary_path, primary_first_slot, num_slots, edge_ids)
+            elif primary_first_slot is None:
+                # demand is blocked
+                if stats is not None:
+                    stats.count('blocked_demands')
+                primary_path = None
+
+        if stats is not None:
+            stats.count('candidates_tried')
+        if primary_path is not None:
+            record_allocation(allocations, (src_id, dst_id), primary_path, primary_first_slot, primary_num_slots)
         chosen_paths[(src_id, dst_id)] = primary_path
 
     return chosen_paths
 
-def k_shortest_path_shared_protection(G, k_SP_dict, traffic_dict):
+@timed('k_shortest_path_shared_protection')
+def k_shortest_path_shared_protection(G, k_SP_dict, traffic_dict, allocations=None):
     chosen_paths = {}
+    path_table = get_path_table(G, k_SP_dict)
+    sharing = get_backup_sharing(G)
+    stats = instrumentation.active
+    ledger = G.graph.get('resource_ledger')
 
-    # Group demands that share a common link or node
-    group_dict = {}
     for demand_id, (src_id, dst_id) in enumerate(traffic_dict.keys()):
-        for path in k_SP_dict[(src_id, dst_id)]:
-            for u, v in zip(path[:-1], path[1:]):
-                group_key = frozenset([u, v])
-                if group_key not in group_dict:
-                    group_dict[group_key] = []
-                group_dict[group_key].append((demand_id, src_id, dst_id))
-
-    # Compute shared backup paths for each group
-    for group_demands in group_dict.values():
-        # Compute all k shortest paths for each demand in the group
-        k_paths_dict = {}
-        for demand_id, src_id, dst_id in group_demands:
-            k_paths_dict[demand_id] = k_SP_dict[(src_id, dst_id)]
-
-        # Find the common backup path that satisfies any two demands in the group
-        common_backup_path = None
-        for i, (demand_id_1, _, _) in enumerate(group_demands):
-            for j, (demand_id_2, _, _) in enumerate(group_demands[i+1:], start=i+1):
-                backup_paths_1 = k_paths_dict[demand_id_1][1:]
-                backup_paths_2 = k_paths_dict[demand_id_2][1:]
-                for path_1 in backup_paths_1:
-                    for path_2 in backup_paths_2:
-                        if path_1 == path_2:
-                            common_backup_path = path_1
-                            break
-                    if common_backup_path is not None:
-                        break
-                if common_backup_path is not None:
-                    break
-            if common_backup_path is not None:
-                break
-
-        # Allocate primary and backup paths for each demand in the group
-        for demand_id, src_id, dst_id in group_demands:
-            traffic_G = traffic_dict[(src_id, dst_id)]
-            if traffic_G < 50:
-                traffic_G = 100
-            else:
-                traffic_G = round(traffic_G, -2)
-            primary_path = k_paths_dict[demand_id][0]
-            num_slots = choose_MF(G, primary_path, traffic_G)
-            primary_first_slot = First_Fit(G, primary_path, num_slots)
-            # occupy_spectrum(G, primary_path, primary_first_slot, num_slots)
-            backup_path = None
-            if common_backup_path is not None:
-                backup_path = common_backup_path
-                num_slots = choose_MF(G, common_backup_path, traffic_G)
-                first_slot = First_Fit(G, common_backup_path, num_slots)
-                occupy_spectrum(G, common_backup_path, first_slot, num_slots)
-            else:
-                backup_paths = k_paths_dict[demand_id][1:]
-                for path in backup_paths:
-                    if path != primary_path:
-                        backup_path = path
-                        num_slots = choose_MF(G, backup_path, traffic_G)
-                        first_slot = First_Fit(G, backup_path, num_slots)
-                        # occupy_spectrum(G, backup_path, first_slot, num_slots)
-                        break
-
-            chosen_paths[(src_id, dst_id)] = (None, backup_path)
-
-    return chosen_paths
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        traffic_G = rounded_traffic(traffic_dict[(src_id, dst_id)])
 
+        rows = path_table.rows(src_id, dst_id)
+        primary_row = rows[0]
+        primary_path = path_table.paths[primary_row]
+        primary_edge_ids = path_table.path_edge_ids(primary_row)
 
+        # Allocate spectrum for primary path
+        num_slots = path_table.slots(primary_row, traffic_G)
+        primary_first_slot = First_Fit(G, primary_path, num_slots, primary_edge_ids)
+        if primary_first_slot is None:
+            # demand is blocked
+            if stats is not None:
+                stats.count('candidates_tried')
+                stats.count('blocked_demands')
+            chosen_paths[(src_id, dst_id)] = (-1, -1)
+            continue
+        if ledger is not None:
+            ledger.add('shared', 'primary', primary_edge_ids, primary_first_slot, num_slots)
+        occupy_spectrum(G, primary_path, primary_first_slot, num_slots, primary_edge_ids)
+        record_allocation(allocations, (src_id, dst_id), primary_path, primary_first_slot, num_slots)
+
+        # Allocate a backup that shares spectrum with the backups of link-disjoint primaries, the candidate
+        # overlapping the most with the backup cells already held
+        backup_rows = list(rows[1:])
+        edge_ids_list = [path_table.path_edge_ids(row) for row in backup_rows]
+        num_slots_list = [path_table.slots(row, traffic_G) for row in backup_rows]
+        primary_bitset = path_bitset(primary_edge_ids)
 
+        backup_path = None
+        backup = cheapest_backup(sharing, edge_ids_list, num_slots_list, primary_bitset)
+        if backup is not None:
+            i, first_slot = backup
+            edge_ids, num_slots = edge_ids_list[i], num_slots_list[i]
+            backup_path = path_table.paths[backup_rows[i]]
+            if ledger is not None:
+                ledger.add('shared', 'backup', edge_ids, first_slot, num_slots)
+            sharing_id = sharing.allocate(edge_ids, first_slot, num_slots, primary_bitset)
+            record_allocation(allocations, (src_id, dst_id), backup_path, first_slot, num_slots, sharing_id)
+
+        if stats is not None:
+            stats.count('candidates_tried', 1 + len(backup_rows))
+            if backup_path is None:
+                stats.count('unprotected_demands')
 
+        chosen_paths[(src_id, dst_id)] = (primary_path, backup_path)
 
+    return chosen_paths
@@ -0,0 +1,71 @@
+import functools
+import json
+import time
+from contextlib import contextmanager
+
+# Stats collecting the instrumented calls of this process, None when instrumentation is off
+active = None
+
+
+class Stats:
+    '''wall time and calls per phase, plus event counters, of the instrumented calls'''
+
+    __slots__ = ('seconds', 'calls', 'counters')
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+
+    def add_time(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def merge(self, other):
+        '''add the phases and counters of another Stats, e.g. one collected in a worker process'''
+        for phase, seconds in other.seconds.items():
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+            self.calls[phase] = self.calls.get(phase, 0) + other.calls[phase]
+        for counter, n in other.counters.items():
+            self.count(counter, n)
+
+    def as_dict(self):
+        return {'phases': {phase: {'seconds': seconds, 'calls': self.calls[phase]}
+                           for phase, seconds in self.seconds.items()},
+                'counters': dict(self.counters)}
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+@contextmanager
+def collect_stats(stats=None):
+    '''turn instrumentation on for the calls made inside the with block, yields the Stats collecting them'''
+    global active
+    previous = active
+    active = stats if stats is not None else Stats()
+    try:
+        yield active
+    finally:
+        active = previous
+
+
+def timed(phase):
+    '''decorator adding the wall time of every call to phase while instrumentation is on'''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if active is None:
+                return function(*args, **kwargs)
+            stats = active
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats.add_time(phase, time.perf_counter() - start)
+        return wrapper
+    return decorator
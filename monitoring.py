@@ -0,0 +1,132 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+
+
+class PathMonitor:
+    '''asyncio scheduler of periodic path probes for protected demands
+
+    Demands sit in a heap ordered by their next due time, so each wake-up only touches the demands that are due.
+    Every demand has its own interval, at most max_concurrent_probes probes run at a time, and cancelling the task
+    running run() stops the monitor cleanly.
+
+    probe(demand, status) returns True while the active path is healthy. Plain functions run inline in the
+    scheduler, coroutine functions run as tasks bounded by max_concurrent_probes.
+    on_failure(demand, status) is called when a probe fails, by default it switches the demand to its backup. A
+    probe raising an exception counts as failed, the error is kept in status['last_error'] and the demand stays
+    monitored.
+    '''
+
+    def __init__(self, probe, on_failure=None, max_concurrent_probes=64):
+        self.probe = probe
+        self.on_failure = on_failure if on_failure is not None else switch_to_backup
+        self.max_concurrent_probes = max_concurrent_probes
+        self.probe_is_async = inspect.iscoroutinefunction(probe)
+
+        # {demand: status dict}, the heap holds (due time, sequence, demand, generation)
+        self.path_status = {}
+        self.schedule = []
+        self.sequence = itertools.count()
+        self.wake_up = None
+
+    def add(self, demand, primary, backup, interval, **details):
+        '''start monitoring a demand, replacing any previous entry'''
+        generation = self.path_status[demand]['generation'] + 1 if demand in self.path_status else 0
+        self.path_status[demand] = dict(details, primary=primary, backup=backup, active='primary',
+                                        interval=interval, last_checked=None, generation=generation)
+        heapq.heappush(self.schedule, (self._now(), next(self.sequence), demand, generation))
+        if self.wake_up is not None:
+            self.wake_up.set()
+
+    def remove(self, demand):
+        '''stop monitoring a demand, its heap entry is dropped when it comes due'''
+        self.path_status.pop(demand, None)
+
+    def _now(self):
+        try:
+            return asyncio.get_running_loop().time()
+        except RuntimeError:
+            return 0.0
+
+    def _reschedule(self, demand, status, due):
+        now = self._now()
+        status['last_checked'] = now
+        if self.path_status.get(demand) is status:
+            # keep the phase of the demand unless the probe overran a whole interval
+            heapq.heappush(self.schedule, (max(due + status['interval'], now), next(self.sequence), demand,
+                                           status['generation']))
+
+    def _probe_failed(self, demand, status, error):
+        status['last_error'] = repr(error)
+        self.on_failure(demand, status)
+
+    async def _run_probe(self, demand, status, due, semaphore):
+        try:
+            try:
+                healthy = await self.probe(demand, status)
+            except Exception as error:
+                self._probe_failed(demand, status, error)
+            else:
+                if not healthy:
+                    self.on_failure(demand, status)
+        finally:
+            semaphore.release()
+            self._reschedule(demand, status, due)
+            self.wake_up.set()
+
+    async def run(self, duration=None):
+        '''probe the due demands until cancelled, or for duration seconds'''
+        self.wake_up = asyncio.Event()
+        semaphore = asyncio.Semaphore(self.max_concurrent_probes)
+        probes = set()
+        stop_time = None if duration is None else self._now() + duration
+
+        # entries queued before the loop started are due right away
+        start = self._now()
+        self.schedule = [(start, sequence, demand, generation) for _, sequence, demand, generation in self.schedule]
+        heapq.heapify(self.schedule)
+
+        try:
+            while stop_time is None or self._now() < stop_time:
+                now = self._now()
+                while self.schedule and self.schedule[0][0] <= now:
+                    due, _, demand, generation = heapq.heappop(self.schedule)
+                    status = self.path_status.get(demand)
+                    if status is None or status['generation'] != generation:
+                        continue
+
+                    if self.probe_is_async:
+                        await semaphore.acquire()
+                        probe = asyncio.create_task(self._run_probe(demand, status, due, semaphore))
+                        probes.add(probe)
+                        probe.add_done_callback(probes.discard)
+                    else:
+                        try:
+                            if not self.probe(demand, status):
+                                self.on_failure(demand, status)
+                        except Exception as error:
+                            self._probe_failed(demand, status, error)
+                        finally:
+                            self._reschedule(demand, status, due)
+
+                # sleep until the next demand is due, a reschedule or an addition wakes us earlier
+                timeout = self.schedule[0][0] - self._now() if self.schedule else None
+                if stop_time is not None:
+                    remaining = stop_time - self._now()
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                self.wake_up.clear()
+                try:
+                    await asyncio.wait_for(self.wake_up.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for probe in probes:
+                probe.cancel()
+            await asyncio.gather(*probes, return_exceptions=True)
+
+
+def switch_to_backup(demand, status):
+    if status['active'] != 'backup':
+        status['active'] = 'backup'
+        print(f"Switching demand {demand} to backup path")
@@ -0,0 +1,76 @@
+import functools
+import hashlib
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+# arguments handed to every worker process once, instead of once per task
+_worker_args = None
+
+
+def _init_worker(shared_args):
+    global _worker_args
+    _worker_args = shared_args
+
+
+def _call_in_worker(function, item):
+    return function(*_worker_args, item)
+
+
+def map_in_workers(function, shared_args, items, num_workers=1, chunksize=1):
+    '''generator of function(*shared_args, item) for every item, in order, spread across processes
+
+    shared_args, such as the graph, are sent once to every worker process instead of once per item. function must
+    be a module-level function so that it can be pickled. With num_workers 1 the items run in this process.
+    '''
+    if num_workers is None or num_workers > 1:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                                 initargs=(shared_args,)) as executor:
+            yield from executor.map(functools.partial(_call_in_worker, function), items, chunksize=chunksize)
+    else:
+        for item in items:
+            yield function(*shared_args, item)
+
+
+def _paths_from_source(G, per_source, num_candidate_paths, src_id):
+    return per_source(G, src_id, num_candidate_paths)
+
+
+def compute_paths_per_source(G, per_source, num_candidate_paths=10, num_workers=1):
+    '''merge per_source(G, src_id, num_candidate_paths) over all the source nodes, sharded across processes'''
+    k_paths_dict = {}
+    # results keep the source order, so the pairs come out in the same order as the serial loop
+    for paths_from_source in map_in_workers(_paths_from_source, (G, per_source, num_candidate_paths), list(G.nodes()),
+                                            num_workers):
+        k_paths_dict.update(paths_from_source)
+    return k_paths_dict
+
+
+def topology_hash(filename):
+    '''sha256 of the topology file content'''
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_candidate_paths(filename, G, compute, num_candidate_paths=10, num_workers=1, cache_dir='path_cache'):
+    '''candidate paths of the topology in filename, read from the on-disk cache or computed and stored there'''
+    key = '{}_k{}_{}'.format(compute.__name__, num_candidate_paths, topology_hash(filename))
+    cache_file = os.path.join(cache_dir, key + '.pkl')
+
+    if os.path.exists(cache_file):
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+
+    k_paths_dict = compute(G, num_candidate_paths=num_candidate_paths, num_workers=num_workers)
+
+    # write to a temporary file first so an interrupted run never leaves a truncated cache entry
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(k_paths_dict, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+
+    return k_paths_dict
@@ -0,0 +1,289 @@
+import heapq
+import itertools
+
+import networkx as nx
+
+from path_cache import compute_paths_per_source
+
+
+def adjacency(G, weight='length'):
+    '''plain dict adjacency {u: {v: length}} of the links leaving every node, and of the links entering it'''
+    out_links = {node: {} for node in G.nodes()}
+    in_links = {node: {} for node in G.nodes()}
+    for u, v, length in G.edges(data=weight):
+        out_links[u][v] = length
+        in_links[v][u] = length
+        if not G.is_directed():
+            out_links[v][u] = length
+            in_links[u][v] = length
+    return out_links, in_links
+
+
+def path_links(G, path):
+    '''links of a path in both directions on undirected graphs'''
+    links = set()
+    for u, v in zip(path, path[1:]):
+        links.add((u, v))
+        if not G.is_directed():
+            links.add((v, u))
+    return links
+
+
+def dijkstra_path(out_links, src_id, dst_id, hidden_nodes=(), hidden_links=()):
+    '''(length, path) of the shortest path avoiding some nodes and links, None if there is none'''
+    dist = {src_id: 0}
+    prev = {}
+    done = set()
+    queue = [(0, src_id)]
+    while queue:
+        d, u = heapq.heappop(queue)
+        if u in done:
+            continue
+        if u == dst_id:
+            path = [dst_id]
+            while path[-1] != src_id:
+                path.append(prev[path[-1]])
+            return d, path[::-1]
+        done.add(u)
+
+        for v, length in out_links[u].items():
+            if v in hidden_nodes or (u, v) in hidden_links:
+                continue
+            nd = d + length
+            if nd < dist.get(v, float('inf')):
+                dist[v] = nd
+                prev[v] = u
+                heapq.heappush(queue, (nd, v))
+
+    return None
+
+
+def yen_k_shortest_paths(out_links, src_id, dst_id, k, hidden_links=frozenset()):
+    '''up to k loopless paths ordered by length (Yen), avoiding hidden_links'''
+    return list(itertools.islice(iter_shortest_paths(out_links, src_id, dst_id, hidden_links), max(k, 1)))
+
+
+def iter_shortest_paths(out_links, src_id, dst_id, hidden_links=frozenset()):
+    '''generator of the loopless paths ordered by length (Yen), each one computed only when it is asked for'''
+    shortest = dijkstra_path(out_links, src_id, dst_id, hidden_links=hidden_links)
+    if shortest is None:
+        return
+    yield shortest[1]
+
+    paths = [shortest]
+    seen = {tuple(shortest[1])}
+    candidates = []
+    tie_break = itertools.count()
+
+    while True:
+        _, last_path = paths[-1]
+        root_length = 0
+        for i in range(len(last_path) - 1):
+            spur_node = last_path[i]
+            root_path = last_path[:i + 1]
+
+            # links leaving the spur node along any accepted path with the same root
+            spur_hidden_links = set(hidden_links)
+            for _, path in paths:
+                if path[:i + 1] == root_path:
+                    spur_hidden_links.add((path[i], path[i + 1]))
+
+            spur = dijkstra_path(out_links, spur_node, dst_id, set(root_path[:-1]), spur_hidden_links)
+            if spur is not None:
+                path = root_path[:-1] + spur[1]
+                if tuple(path) not in seen:
+                    seen.add(tuple(path))
+                    heapq.heappush(candidates, (root_length + spur[0], next(tie_break), path))
+
+            root_length += out_links[last_path[i]][last_path[i + 1]]
+
+        if not candidates:
+            return
+        length, _, path = heapq.heappop(candidates)
+        paths.append((length, path))
+        yield path
+
+
+def suurballe_disjoint_paths(out_links, in_links, src_id, dst_id, k=2, potential=None, hidden_links=()):
+    '''up to k edge-disjoint paths of minimum total length, shortest first (Suurballe / Bhandari)
+
+    potential is the single-source distance map from src_id, shared by all the destinations of that source. The
+    distances of the graph without hidden_links are valid too, as hiding links never makes a distance shorter
+    '''
+    if potential is None:
+        potential = single_source_distances(out_links, src_id, hidden_links)
+    if dst_id not in potential:
+        return []
+
+    # nodes out of reach get the largest distance, which keeps every reduced cost non-negative
+    max_dist = max(potential.values())
+    potential = {node: potential.get(node, max_dist) for node in out_links}
+
+    # (u, v) is in flow when one of the disjoint paths uses link u -> v
+    flow = set()
+
+    for _ in range(k):
+        # Dijkstra over the residual graph with reduced costs
+        dist = {src_id: 0}
+        prev = {}
+        done = set()
+        queue = [(0, src_id)]
+        while queue:
+            d, u = heapq.heappop(queue)
+            if u in done:
+                continue
+            done.add(u)
+            if u == dst_id:
+                break
+
+            for v, length in in_links[u].items():
+                # cancel the flow going the other way
+                if (v, u) in flow:
+                    nd = d - length + potential[u] - potential[v]
+                    if nd < dist.get(v, float('inf')):
+                        dist[v] = nd
+                        prev[v] = u
+                        heapq.heappush(queue, (nd, v))
+            for v, length in out_links[u].items():
+                if (u, v) in flow or (v, u) in flow or (u, v) in hidden_links:
+                    continue
+                nd = d + length + potential[u] - potential[v]
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(queue, (nd, v))
+
+        if dst_id not in done:
+            break
+
+        # augment one unit of flow along the shortest residual path
+        v = dst_id
+        while v != src_id:
+            u = prev[v]
+            if (v, u) in flow:
+                flow.discard((v, u))
+            else:
+                flow.add((u, v))
+            v = u
+
+        # settled nodes are popped in distance order, so the destination has the largest settled distance
+        for node in potential:
+            potential[node] += dist[node] if node in done else dist[dst_id]
+
+    # decompose the flow into paths
+    next_hops = {}
+    for u, v in flow:
+        next_hops.setdefault(u, []).append(v)
+    paths = []
+    while next_hops.get(src_id):
+        path = [src_id]
+        while path[-1] != dst_id:
+            path.append(next_hops[path[-1]].pop())
+        paths.append(path)
+
+    paths.sort(key=lambda path: sum(out_links[u][v] for u, v in zip(path, path[1:])))
+    return paths
+
+
+def single_source_distances(out_links, src_id, hidden_links=()):
+    dist = {src_id: 0}
+    done = {}
+    queue = [(0, src_id)]
+    while queue:
+        d, u = heapq.heappop(queue)
+        if u in done:
+            continue
+        done[u] = d
+        for v, length in out_links[u].items():
+            if (u, v) in hidden_links:
+                continue
+            if d + length < dist.get(v, float('inf')):
+                dist[v] = d + length
+                heapq.heappush(queue, (d + length, v))
+    return done
+
+
+def disjoint_backup_paths_from(G, src_id, num_candidate_paths=10, dst_ids=None):
+    '''shortest primary and min-cost edge-disjoint backups avoiding it, from src_id to every node with a higher id'''
+    out_links, in_links = adjacency(G)
+    k_paths_dict = {}
+
+    # one Dijkstra per source serves the primaries of every destination and is the potential of every Suurballe
+    # run, hiding the links of a primary only removes links, so the full graph distances stay a valid potential
+    distances, primary_paths = nx.single_source_dijkstra(G, src_id, weight='length')
+
+    for dst_id in G.nodes():
+        if src_id >= dst_id or (dst_ids is not None and dst_id not in dst_ids):
+            continue
+        if dst_id not in primary_paths:
+            k_paths_dict[(src_id, dst_id)] = []
+            continue
+
+        primary_path = primary_paths[dst_id]
+        backup_paths = suurballe_disjoint_paths(out_links, in_links, src_id, dst_id, num_candidate_paths,
+                                                potential=distances, hidden_links=path_links(G, primary_path))
+
+        # the shortest path can block every disjoint backup, the min-cost disjoint pair cannot
+        if not backup_paths:
+            disjoint_pair = suurballe_disjoint_paths(out_links, in_links, src_id, dst_id, 2, potential=distances)
+            if len(disjoint_pair) == 2:
+                primary_path = disjoint_pair[0]
+                backup_paths = suurballe_disjoint_paths(out_links, in_links, src_id, dst_id, num_candidate_paths,
+                                                        potential=distances, hidden_links=path_links(G, primary_path))
+
+        k_paths_dict[(src_id, dst_id)] = [primary_path] + backup_paths
+
+    return k_paths_dict
+
+
+def yen_backup_paths_from(G, src_id, num_candidate_paths=10, dst_ids=None):
+    '''shortest primary and the k shortest backups avoiding its links, which may overlap each other'''
+    out_links, _ = adjacency(G)
+    k_paths_dict = {}
+    _, primary_paths = nx.single_source_dijkstra(G, src_id, weight='length')
+
+    for dst_id in G.nodes():
+        if src_id >= dst_id or (dst_ids is not None and dst_id not in dst_ids):
+            continue
+        if dst_id not in primary_paths:
+            k_paths_dict[(src_id, dst_id)] = []
+            continue
+
+        primary_path = primary_paths[dst_id]
+        backup_paths = yen_k_shortest_paths(out_links, src_id, dst_id, num_candidate_paths,
+                                            hidden_links=path_links(G, primary_path))
+        k_paths_dict[(src_id, dst_id)] = [primary_path] + backup_paths
+
+    return k_paths_dict
+
+
+def suurballe_paths_from(G, src_id, num_candidate_paths=10, dst_ids=None):
+    '''min-cost mutually edge-disjoint paths from src_id to every node with a higher id, None without any path'''
+    out_links, in_links = adjacency(G)
+    k_paths_dict = {}
+    distances = single_source_distances(out_links, src_id)
+
+    for dst_id in G.nodes():
+        if src_id >= dst_id or (dst_ids is not None and dst_id not in dst_ids):
+            continue
+
+        paths = suurballe_disjoint_paths(out_links, in_links, src_id, dst_id, num_candidate_paths,
+                                         potential=distances)
+        k_paths_dict[(src_id, dst_id)] = paths if paths else None
+
+    return k_paths_dict
+
+
+def compute_k_disjoint_paths(G, num_candidate_paths=10, num_workers=1):
+    '''drop-in replacement of compute_k_edge_disjoint_paths'''
+    return compute_paths_per_source(G, disjoint_backup_paths_from, num_candidate_paths, num_workers)
+
+
+def compute_k_shortest_backup_paths(G, num_candidate_paths=10, num_workers=1):
+    '''like compute_k_disjoint_paths, with length-ordered Yen backups that may share links with each other'''
+    return compute_paths_per_source(G, yen_backup_paths_from, num_candidate_paths, num_workers)
+
+
+def compute_suurballe_disjoint_paths(G, num_candidate_paths=10, num_workers=1):
+    '''drop-in replacement of compute_1_1_edge_disjoint_paths'''
+    return compute_paths_per_source(G, suurballe_paths_from, num_candidate_paths, num_workers)
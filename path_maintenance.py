@@ -0,0 +1,143 @@
+import networkx as nx
+
+from path_cache import compute_paths_per_source
+from path_engine import disjoint_backup_paths_from
+
+
+def link_key(G, u, v):
+    '''one key per link, the same for both directions on undirected graphs'''
+    return (u, v) if G.is_directed() else frozenset((u, v))
+
+
+class IncrementalPaths:
+    '''candidate paths kept up to date through topology changes
+
+    A reverse index maps every link to the node pairs whose candidates cross it. Removing a link or changing its
+    length recomputes those pairs only. Adding a link or shortening one also recomputes the pairs it may give a
+    shorter primary, and the pairs short of candidates that it may give one more: those touching the link or
+    holding fewer candidates than the degree of their end nodes allows. Primaries and candidate counts match a full
+    recomputation up to ties between equally long paths; the backups of a pair keeping its primary are kept too,
+    even where the new link would allow cheaper ones, until the pair is recomputed.
+
+    The candidate dict is updated in place, so k_paths can be handed to the RSA functions as before. Every change
+    drops the path table of the graph, and changes of the link set drop its spectrum as well: call clear_spectrum
+    before allocating again.
+    '''
+
+    def __init__(self, G, per_source=disjoint_backup_paths_from, num_candidate_paths=10, k_paths=None,
+                 num_workers=1):
+        self.G = G
+        self.per_source = per_source
+        self.num_candidate_paths = num_candidate_paths
+        if k_paths is None:
+            k_paths = compute_paths_per_source(G, per_source, num_candidate_paths, num_workers)
+        self.k_paths = k_paths
+
+        # {link key: pairs whose candidates use it}, {pair: its link keys} and {pair: length of its primary}
+        self.link_pairs = {}
+        self.pair_links = {}
+        self.primary_length = {}
+        for pair in k_paths:
+            self._index(pair)
+
+    def _index(self, pair):
+        keys = set()
+        paths = self.k_paths[pair] or ()
+        for path in paths:
+            for u, v in zip(path, path[1:]):
+                keys.add(link_key(self.G, u, v))
+        for key in keys:
+            self.link_pairs.setdefault(key, set()).add(pair)
+        self.pair_links[pair] = keys
+        if paths:
+            self.primary_length[pair] = sum(self.G.edges[u, v]['length'] for u, v in zip(paths[0], paths[0][1:]))
+
+    def _unindex(self, pair):
+        for key in self.pair_links.pop(pair):
+            pairs = self.link_pairs[key]
+            pairs.discard(pair)
+            if not pairs:
+                del self.link_pairs[key]
+        self.primary_length.pop(pair, None)
+
+    def pairs_using(self, u, v):
+        return set(self.link_pairs.get(link_key(self.G, u, v), ()))
+
+    def pairs_gaining(self, u, v):
+        '''pairs that link (u, v), as it is now in G, may give a shorter primary or an additional candidate
+
+        A path crossing the link is at least as long as the shortest detour through it, d(src, u) + length +
+        d(v, dst), so only the pairs whose primary is longer than that detour can get a shorter one. Two
+        single-source Dijkstra runs, from v and into u, give the detour of every pair.
+        '''
+        G = self.G
+        length = G.edges[u, v]['length']
+        from_v = nx.single_source_dijkstra_path_length(G, v, weight='length')
+        if G.is_directed():
+            to_u = nx.single_source_dijkstra_path_length(G.reverse(copy=False), u, weight='length')
+        else:
+            # on undirected graphs distances are symmetric and the link is crossed either way
+            to_u = from_u = nx.single_source_dijkstra_path_length(G, u, weight='length')
+            to_v = from_v
+        inf = float('inf')
+
+        pairs = set()
+        for pair, paths in self.k_paths.items():
+            src_id, dst_id = pair
+            detour = to_u.get(src_id, inf) + length + from_v.get(dst_id, inf)
+            if not G.is_directed():
+                detour = min(detour, to_v.get(src_id, inf) + length + from_u.get(dst_id, inf))
+            if detour == inf:
+                continue
+
+            num_paths = len(paths) if paths else 0
+            if not num_paths:
+                pairs.add(pair)
+            elif detour < self.primary_length[pair]:
+                pairs.add(pair)
+            elif num_paths <= self.num_candidate_paths and (
+                    src_id in (u, v) or dst_id in (u, v) or num_paths < min(G.degree(src_id), G.degree(dst_id))):
+                pairs.add(pair)
+        return pairs
+
+    def recompute(self, pairs):
+        '''recompute the candidates of some node pairs, one per_source call per source node'''
+        dst_ids_per_source = {}
+        for src_id, dst_id in pairs:
+            dst_ids_per_source.setdefault(src_id, set()).add(dst_id)
+
+        for src_id, dst_ids in dst_ids_per_source.items():
+            for pair, paths in self.per_source(self.G, src_id, self.num_candidate_paths, dst_ids).items():
+                self._unindex(pair)
+                self.k_paths[pair] = paths
+                self._index(pair)
+
+        self.G.graph.pop('path_table', None)
+        return pairs
+
+    def _links_changed(self):
+        # edge ids follow the link order of the graph, the spectrum store no longer matches it
+        for name in ('spectrum', 'backup_sharing', 'path_table'):
+            self.G.graph.pop(name, None)
+
+    def add_link(self, u, v, length, **attributes):
+        '''add link (u, v) and return the pairs recomputed'''
+        self.G.add_edge(u, v, length=length, **attributes)
+        self._links_changed()
+        return self.recompute(self.pairs_gaining(u, v))
+
+    def remove_link(self, u, v):
+        '''remove link (u, v) and return the pairs recomputed'''
+        pairs = self.pairs_using(u, v)
+        self.G.remove_edge(u, v)
+        self._links_changed()
+        return self.recompute(pairs)
+
+    def set_length(self, u, v, length):
+        '''change the length of link (u, v) and return the pairs recomputed'''
+        old_length = self.G.edges[u, v]['length']
+        self.G.edges[u, v]['length'] = length
+        pairs = self.pairs_using(u, v)
+        if length < old_length:
+            pairs |= self.pairs_gaining(u, v)
+        return self.recompute(pairs)
@@ -0,0 +1,124 @@
+import hashlib
+
+import numpy as np
+
+from spectrum import edge_index
+
+# {traffic_request_Gbit/s: [(maximum_reach, number_of_slots)]}
+MF_option = {100: [(4500, 6), (3500, 4), (3000, 3), (2500, 2), (1500, 2)],
+             200: [(2500, 8), (1500, 6), (1000, 5), (700, 4), (500, 3)],
+             300: [(2000, 10), (1500, 8), (1000, 7), (800, 6), (500, 4)],
+             400: [(2000, 16), (1000, 12), (800, 8), (600, 6), (200, 5)],
+             500: [(1500, 20), (800, 16), (600, 12), (500, 8), (200, 7)],
+             600: [(1000, 28), (700, 22), (500, 20), (400, 16), (200, 10)],
+             700: [(1000, 32), (600, 26), (400, 24), (300, 20), (200, 14)],
+             800: [(800, 36), (500, 32), (300, 28), (250, 24), (200, 18)],
+             900: [(600, 42), (400, 36), (250, 32), (200, 28), (100, 24)],
+             1000: [(500, 48), (300, 42), (200, 38), (150, 32), (100, 24)]}
+
+traffic_classes = sorted(MF_option)
+
+
+def rounded_traffic(traffic_G):
+    '''traffic request rounded to a row of MF_option: 100 Gb/s below 50 Gb/s, else to the nearest hundred'''
+    if traffic_G < 50:
+        return 100
+    traffic_G = round(traffic_G, -2)
+    if traffic_G not in MF_option:
+        raise ValueError('no modulation format carries {} Gb/s'.format(traffic_G))
+    return traffic_G
+
+
+def traffic_class(traffic_G):
+    '''column of a traffic request in the slot count table, rounded as rounded_traffic does'''
+    return int(rounded_traffic(traffic_G)) // 100 - 1
+
+
+def MF_num_slots(path_length, traffic_G):
+    '''lowest number of slots among the modulation formats reaching path_length, 1 if none does'''
+    min_slots = 1e6
+
+    # choose option with lowest number of slots with reach higher than path length
+    for max_reach, num_slots in MF_option[traffic_G]:
+        if path_length <= max_reach and num_slots < min_slots:
+            min_slots = num_slots
+
+    # return default value of 1 if no valid modulation format option was found
+    if min_slots == 1e6:
+        return 1
+    else:
+        return int(min_slots)
+
+
+class PathTable:
+    '''candidate paths of every node pair with their edge ids, lengths and slot counts per traffic class'''
+
+    __slots__ = ('k_paths', 'pair_rows', 'path_rows', 'paths', 'edge_ptr', 'edge_ids', 'length', 'num_slots',
+                 '_digest')
+
+    def __init__(self, G, k_paths_dict):
+        self.k_paths = k_paths_dict
+        index = edge_index(G)
+        edge_length = np.array([length for _, _, length in G.edges(data='length')], dtype=float)
+
+        # one row per candidate path, the rows of a node pair are contiguous
+        self.pair_rows = {}
+        self.path_rows = {}
+        self.paths = []
+        hops = []
+        edge_ids = []
+        for pair, paths in k_paths_dict.items():
+            start = len(self.paths)
+            for path in paths or ():
+                self.path_rows.setdefault(tuple(path), len(self.paths))
+                self.paths.append(path)
+                hops.append(len(path) - 1)
+                edge_ids.extend(index[link] for link in zip(path, path[1:]))
+            self.pair_rows[pair] = (start, len(self.paths))
+
+        # edge ids of row i are edge_ids[edge_ptr[i]:edge_ptr[i + 1]]
+        self.edge_ptr = np.zeros(len(self.paths) + 1, dtype=np.intp)
+        np.cumsum(hops, out=self.edge_ptr[1:])
+        self.edge_ids = np.array(edge_ids, dtype=np.intp)
+
+        self.length = np.zeros(len(self.paths))
+        has_links = np.diff(self.edge_ptr) > 0
+        if len(self.edge_ids):
+            self.length[has_links] = np.add.reduceat(edge_length[self.edge_ids], self.edge_ptr[:-1][has_links])
+
+        # number of slots of every path for every traffic class, 1 where no format reaches
+        self.num_slots = np.empty((len(self.paths), len(traffic_classes)), dtype=np.int16)
+        for column, traffic_G in enumerate(traffic_classes):
+            min_slots = np.full(len(self.paths), 1e6)
+            for max_reach, num_slots in MF_option[traffic_G]:
+                min_slots = np.where(self.length <= max_reach, np.minimum(min_slots, num_slots), min_slots)
+            self.num_slots[:, column] = np.where(min_slots == 1e6, 1, min_slots)
+        self._digest = None
+
+    def digest(self):
+        '''sha256 of the candidate paths of every pair, computed once as the table never changes'''
+        if self._digest is None:
+            digest = hashlib.sha256(repr(list(self.pair_rows.items())).encode())
+            for array in (self.edge_ptr, self.edge_ids, self.num_slots):
+                digest.update(np.ascontiguousarray(array).tobytes())
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    def rows(self, src_id, dst_id):
+        '''row range of the candidate paths of a node pair'''
+        return range(*self.pair_rows[(src_id, dst_id)])
+
+    def row_batches(self, rows):
+        '''rows in batches for a batched First-Fit, all of them at once as they are already computed'''
+        if len(rows):
+            yield rows
+
+    def find(self, path):
+        '''row of a candidate path, None if it is not in the table'''
+        return self.path_rows.get(tuple(path))
+
+    def path_edge_ids(self, row):
+        return self.edge_ids[self.edge_ptr[row]:self.edge_ptr[row + 1]]
+
+    def slots(self, row, traffic_G):
+        return int(self.num_slots[row, traffic_class(traffic_G)])
@@ -0,0 +1,85 @@
+import pickle
+
+import numpy as np
+
+roles = ('primary', 'backup')
+
+
+class ResourceLedger:
+    '''running totals of the spectrum and transponders every scheme holds, kept up to date by the allocators
+
+    Cells are (link, slot) pairs. A shared backup cell counts once, for the backup that occupied it first, and is
+    given back when the last backup holding it is released. Every path counts one transponder.
+    '''
+
+    __slots__ = ('store', 'link_cells', 'cells', 'transponders')
+
+    def __init__(self, store):
+        self.store = store
+        # {scheme: cells per link}, {(scheme, role): cells} and {scheme: transponders}
+        self.link_cells = {}
+        self.cells = {}
+        self.transponders = {}
+
+    def _scheme_link_cells(self, scheme):
+        link_cells = self.link_cells.get(scheme)
+        if link_cells is None:
+            link_cells = self.link_cells[scheme] = np.zeros(len(self.store.slots), dtype=np.int64)
+        return link_cells
+
+    def add(self, scheme, role, edge_ids, first_slot, num_slots):
+        '''account a path about to occupy slots [first_slot, first_slot + num_slots), before the occupation'''
+        block = self.store.slots[edge_ids, first_slot:first_slot + num_slots]
+        new_cells = num_slots - np.count_nonzero(block, axis=1)
+        self._scheme_link_cells(scheme)[edge_ids] += new_cells
+        self.cells[(scheme, role)] = self.cells.get((scheme, role), 0) + int(new_cells.sum())
+        self.transponders[scheme] = self.transponders.get(scheme, 0) + 1
+
+    def remove(self, scheme, role, edge_ids, first_slot, num_slots):
+        '''account a path whose slots were just released, after the release'''
+        block = self.store.slots[edge_ids, first_slot:first_slot + num_slots]
+        freed_cells = num_slots - np.count_nonzero(block, axis=1)
+        self._scheme_link_cells(scheme)[edge_ids] -= freed_cells
+        self.cells[(scheme, role)] -= int(freed_cells.sum())
+        self.transponders[scheme] -= 1
+
+    def clear(self):
+        self.link_cells.clear()
+        self.cells.clear()
+        self.transponders.clear()
+
+    def copy(self, store):
+        '''independent ledger over store, a copy of the spectrum this ledger describes'''
+        ledger = ResourceLedger(store)
+        ledger.link_cells = {scheme: link_cells.copy() for scheme, link_cells in self.link_cells.items()}
+        ledger.cells = dict(self.cells)
+        ledger.transponders = dict(self.transponders)
+        return ledger
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            pickle.dump((self.link_cells, self.cells, self.transponders), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, filename, store):
+        ledger = cls(store)
+        with open(filename, 'rb') as f:
+            ledger.link_cells, ledger.cells, ledger.transponders = pickle.load(f)
+        return ledger
+
+    def occupied_cells(self, scheme, role=None):
+        if role is None:
+            return sum(self.cells.get((scheme, role), 0) for role in roles)
+        return self.cells.get((scheme, role), 0)
+
+    def protection_overhead(self, scheme):
+        '''backup cells per primary cell, None before any primary is allocated'''
+        primary_cells = self.cells.get((scheme, 'primary'), 0)
+        return self.cells.get((scheme, 'backup'), 0) / primary_cells if primary_cells else None
+
+    def summary(self):
+        return {scheme: {'transponders': transponders,
+                         'primary_cells': self.occupied_cells(scheme, 'primary'),
+                         'backup_cells': self.occupied_cells(scheme, 'backup'),
+                         'protection_overhead': self.protection_overhead(scheme)}
+                for scheme, transponders in self.transponders.items()}
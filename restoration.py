@@ -0,0 +1,121 @@
+import numpy as np
+
+from failure_analysis import build_link_index, hit_demands
+from function import get_path_table, get_backup_sharing, occupy_spectrum, snapshot_spectrum, restore_spectrum
+from instrumentation import timed
+from path_table import rounded_traffic
+from spectrum import path_cells
+
+
+def _release_lost(G, allocations, lost, scheme):
+    '''give back the spectrum of the lost demands, the dedicated cells of all of them in one call'''
+    store = G.graph['spectrum']
+    ledger = G.graph.get('resource_ledger') if scheme is not None else None
+
+    # shared backup cells may still protect other demands, they go back through the sharing ledger one by one
+    dedicated = []
+    for demand in lost:
+        for position, (path, first_slot, num_slots, sharing_id) in enumerate(allocations[demand]):
+            edge_ids = store.path_edge_ids(path)
+            if sharing_id is None:
+                dedicated.append((position, edge_ids, first_slot, num_slots))
+                continue
+            get_backup_sharing(G).release(sharing_id, edge_ids, first_slot, num_slots)
+            if ledger is not None:
+                ledger.remove(scheme, 'backup', edge_ids, first_slot, num_slots)
+    if not dedicated:
+        return
+
+    _, edge_ids_list, first_slots, num_slots_list = zip(*dedicated)
+    store.release_cells(*path_cells(edge_ids_list, first_slots, num_slots_list))
+
+    if ledger is not None:
+        # dedicated paths never share cells, so every path finds its own cells freed
+        for position, edge_ids, first_slot, num_slots in dedicated:
+            ledger.remove(scheme, 'primary' if position == 0 else 'backup', edge_ids, first_slot, num_slots)
+
+
+@timed('restore_demands')
+def restore_demands(G, k_paths, traffic_dict, allocations, failed_edge_ids, scheme=None, priority=None,
+                    link_index=None):
+    '''re-route at once the demands a failure left without any working path, on the spectrum of G
+
+    Demands keeping a path off the failed links are left to their protection. The lost ones give back all their
+    spectrum in one batch, then take, by decreasing priority, the first candidate avoiding the failed links with
+    a First-Fit block. The First-Fit of every candidate is computed in one batched pass and only checked again on
+    the links the restoration itself occupied. priority maps demands to numbers, larger first, and defaults to the
+    traffic of the demand; ties keep the traffic_dict order. Restored demands get a single unprotected working
+    path in allocations, blocked ones are removed from it. Spectrum, ledgers and allocations change together: if
+    anything fails halfway, they are all left as they were.
+    '''
+    store = G.graph['spectrum']
+    path_table = get_path_table(G, k_paths)
+    ledger = G.graph.get('resource_ledger') if scheme is not None else None
+    if link_index is None:
+        link_index = build_link_index(G, allocations)
+    hit_paths, lost = hit_demands(allocations, link_index, failed_edge_ids)
+
+    result = {'failed_edge_ids': tuple(failed_edge_ids), 'affected': len(hit_paths), 'lost': len(lost),
+              'restored': {}, 'blocked': []}
+    if not lost:
+        return result
+
+    if priority is None:
+        priority = traffic_dict
+    lost_set = set(lost)
+    order = sorted((demand for demand in traffic_dict if demand in lost_set),
+                   key=lambda demand: -priority.get(demand, 0))
+    if len(order) < len(lost):
+        raise ValueError('every allocated demand must be in traffic_dict')
+
+    failed_links = np.zeros(G.number_of_edges(), dtype=bool)
+    failed_links[list(failed_edge_ids)] = True
+
+    snapshot = snapshot_spectrum(G)
+    try:
+        _release_lost(G, allocations, lost, scheme)
+
+        # candidates avoiding the failed links, the ones of a demand contiguous and in path table order
+        candidate_ptr = [0]
+        paths, edge_ids_list, num_slots_list = [], [], []
+        for demand in order:
+            traffic_G = rounded_traffic(traffic_dict[demand])
+            for row in path_table.rows(*demand):
+                edge_ids = path_table.path_edge_ids(row)
+                if not failed_links[edge_ids].any():
+                    paths.append(path_table.paths[row])
+                    edge_ids_list.append(edge_ids)
+                    num_slots_list.append(path_table.slots(row, traffic_G))
+            candidate_ptr.append(len(paths))
+        first_slots = store.first_fit_paths(edge_ids_list, num_slots_list)
+
+        # a block still free on the links taken meanwhile is still the first fit, as nothing was released since
+        taken_links = np.zeros(G.number_of_edges(), dtype=bool)
+        records = {}
+        for demand, start, end in zip(order, candidate_ptr, candidate_ptr[1:]):
+            for i in range(start, end):
+                edge_ids, num_slots, first_slot = edge_ids_list[i], num_slots_list[i], int(first_slots[i])
+                if first_slot < 0:
+                    continue
+                if taken_links[edge_ids].any() and not store.is_free(edge_ids, first_slot, num_slots):
+                    first_slot = store.first_fit(edge_ids, num_slots)
+                    if first_slot is None:
+                        continue
+                if ledger is not None:
+                    ledger.add(scheme, 'primary', edge_ids, first_slot, num_slots)
+                occupy_spectrum(G, paths[i], first_slot, num_slots, edge_ids)
+                taken_links[edge_ids] = True
+                records[demand] = [(paths[i], first_slot, num_slots, None)]
+                break
+    except BaseException:
+        restore_spectrum(G, snapshot)
+        raise
+
+    for demand in order:
+        if demand in records:
+            allocations[demand] = records[demand]
+            result['restored'][demand] = records[demand][0][0]
+        else:
+            del allocations[demand]
+            result['blocked'].append(demand)
+    return result
@@ -0,0 +1,143 @@
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+
+from function import get_path_table
+
+# part of every key, bump it when a change to the allocators or to how a metric is computed changes the results
+version = 3
+
+# row codes of the chosen_paths markers that are not paths
+_markers = {-1: -1, None: -2}
+_marker_values = {code: value for value, code in _markers.items()}
+
+
+def topology_digest(G):
+    '''sha256 of the nodes, links and link lengths of G, in G.edges() order'''
+    digest = hashlib.sha256(repr((G.is_directed(), list(G.nodes()))).encode())
+    digest.update(repr(list(G.edges(data='length'))).encode())
+    return digest.hexdigest()
+
+
+def traffic_digest(traffic_dict):
+    '''sha256 of the demands and their traffic, in traffic_dict order'''
+    return hashlib.sha256(repr(list(traffic_dict.items())).encode()).hexdigest()
+
+
+def encode_chosen_paths(path_table, chosen_paths):
+    '''chosen paths as an int32 array of path table rows, one column per path of a demand, in demand order'''
+    single = any(not isinstance(value, tuple) for value in chosen_paths.values())
+    values = [(value,) if single else value for value in chosen_paths.values()]
+    rows = np.full((len(values), max(map(len, values), default=1)), _markers[None], dtype=np.int32)
+    for i, paths in enumerate(values):
+        for j, path in enumerate(paths):
+            rows[i, j] = _markers[path] if path is None or path == -1 else path_table.find(path)
+    return rows, single
+
+
+def decode_chosen_paths(path_table, demands, rows, single):
+    chosen_paths = {}
+    for demand, demand_rows in zip(demands, rows.tolist()):
+        paths = tuple(_marker_values[row] if row < 0 else path_table.paths[row] for row in demand_rows)
+        chosen_paths[demand] = paths[0] if single else paths
+    return chosen_paths
+
+
+class ResultCache:
+    '''content-addressed store of RSA results, one compressed .npz file per (topology, candidates, traffic, scheme)
+
+    The key hashes every input, so a changed topology, candidate set or traffic is a different entry and stale
+    entries are never read, they only age out. Reads refresh the modification time of an entry, and writes drop
+    the least recently used entries until the folder holds at most max_bytes.
+    '''
+
+    def __init__(self, cache_dir='rsa_cache', max_bytes=256 << 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, G, k_paths, traffic_dict, scheme, num_slots, metric_names=()):
+        '''key of an RSA run on a clear spectrum, None for candidates without a fixed table such as lazy ones
+
+        metric_names are the metrics cached with the run, so adding or dropping one is a different entry
+        '''
+        path_table = get_path_table(G, k_paths)
+        if not hasattr(path_table, 'digest'):
+            return None
+        parts = (version, topology_digest(G), path_table.digest(), traffic_digest(traffic_dict), scheme, num_slots,
+                 tuple(sorted(metric_names)))
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def get(self, key, G, k_paths, traffic_dict):
+        '''(chosen paths, metrics) of a key, None if it is not cached'''
+        filename = self._filename(key)
+        try:
+            with np.load(filename) as entry:
+                rows, single = entry['rows'], bool(entry['single'])
+                metrics = json.loads(entry['metrics'].tobytes().decode())
+            # least recently used entries go first
+            os.utime(filename)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return None
+        return decode_chosen_paths(get_path_table(G, k_paths), traffic_dict.keys(), rows, single), metrics
+
+    def put(self, key, G, k_paths, chosen_paths, metrics):
+        rows, single = encode_chosen_paths(get_path_table(G, k_paths), chosen_paths)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, rows=rows, single=np.array(single),
+                            metrics=np.frombuffer(json.dumps(metrics).encode(), dtype=np.uint8))
+
+        # write to a temporary file first so an interrupted run never leaves a truncated entry
+        os.makedirs(self.cache_dir, exist_ok=True)
+        filename = self._filename(key)
+        tmp_file = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_file, filename)
+        self.evict()
+
+    def evict(self):
+        '''remove the least recently used entries until the cache fits in max_bytes'''
+        entries = []
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith('.npz'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def run(self, G, k_paths, traffic_dict, scheme, RSA, metrics, num_slots, metric_names=()):
+        '''(chosen paths, metrics, whether they came from the cache) of RSA on traffic_dict
+
+        metrics(chosen_paths) reads the metrics named metric_names to cache off G right after RSA ran, on a miss.
+        On a hit RSA is not run and the spectrum of G is left as it is. Only runs starting from a clear spectrum are
+        cached.
+        '''
+        key = self.key(G, k_paths, traffic_dict, scheme, num_slots, metric_names)
+        if key is None or G.graph['spectrum'].occupation() or G.graph.get('backup_sharing') is not None:
+            chosen_paths = RSA(G, k_paths, traffic_dict)
+            return chosen_paths, metrics(chosen_paths), False
+        cached = self.get(key, G, k_paths, traffic_dict)
+        if cached is not None:
+            return cached + (True,)
+        chosen_paths = RSA(G, k_paths, traffic_dict)
+        values = metrics(chosen_paths)
+        self.put(key, G, k_paths, chosen_paths, values)
+        return chosen_paths, values, False
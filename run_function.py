@@ -1,8 +1,11 @@
 import networkx as nx
-import json
+import asyncio
 import heapq
-import random
-import time
+
+import numpy as np
+
+from monitoring import PathMonitor
+from path_cache import compute_paths_per_source
 
 # def k_shortest_path_first_fit_1_plus_1_RSA(G, k_SP_dict, traffic_dict):
 #     chosen_paths = {}
@@ -41,60 +44,31 @@ import time
 #
 #     return chosen_paths
 
-def proactive_1_plus_1_protection(G, k_paths, traffic_dict, interval):
+def proactive_1_plus_1_protection(G, k_paths, traffic_dict, interval, duration=None, max_concurrent_probes=64):
     '''Proactive 1+1 protection scheme with periodic path testing'''
 
-    # initialize path status dictionary
-    path_status = {}
-    for demand, paths in k_paths.items():
-        path_status[demand] = {'primary': paths[0], 'backup': paths[1], 'active': 'primary', 'last_checked': 0}
-
-    # iterate over time intervals
-    while True:
-
-        # check path statuses for each demand
-        for demand, status in path_status.items():
-
-            # check if it's time to test the primary path
-            if time.time() - status['last_checked'] >= interval:
-
-                # test primary path
-                primary_PLR = calculate_PLR(G, demand, status['primary'])
-                if primary_PLR > 0.1:
-                    # if primary path PLR is higher than threshold, switch to backup path
-                    status['active'] = 'backup'
-                    print(f"Switching demand {demand} to backup path")
-
-                # update last checked time
-                status['last_checked'] = time.time()
-
-        # sleep for the interval
-        time.sleep(interval)
+    # test the primary path, a PLR higher than the threshold switches the demand to its backup path
+    def probe(demand, status):
+        return calculate_PLR(G, traffic_dict[demand], status['primary']) <= 0.1
 
+    monitor = PathMonitor(probe, max_concurrent_probes=max_concurrent_probes)
+    for demand, paths in k_paths.items():
+        monitor.add(demand, paths[0], paths[1], interval)
 
-def is_path_working(G, path, demand):
-    '''Check if path is working by verifying that there are enough free spectrum slots'''
-
-    num_slots = G.graph['num_slots']
-
-    # find first fit along path
-    first_slot = First_Fit(G, path, num_slots)
-
-    if first_slot is not None:
-        # mark the slots as reserved for the demand
-        for link in zip(path, path[1:]):
-            for i in range(first_slot, first_slot + num_slots):
-                G.edges[link]['spectrum_slots'][i] = demand['demand_id']
+    # runs until interrupted, or for duration seconds
+    asyncio.run(monitor.run(duration))
+    return monitor.path_status
 
-        # simulate transmission along the path
-        for link in zip(path, path[1:]):
-            for slot in range(demand['num_slots']):
-                if G.edges[link]['spectrum_slots'][demand['first_slot'] + slot] != demand['demand_id']:
-                    return 1
+def probe_paths(G, paths, first_slots, num_slots_list, failed_links=None):
+    '''PLR of many paths in one read-only pass: the share of their (link, slot) cells that are not intact'''
+    store = G.graph['spectrum']
+    return store.lost_share([store.path_edge_ids(path) for path in paths], first_slots, num_slots_list,
+                            failed_links)
 
-        return 0
 
-    return 1
+def is_path_working(G, path, demand, failed_links=None):
+    '''PLR of a demand along a path, 0 when all its slots are still held on every link'''
+    return float(probe_paths(G, [path], [demand['first_slot']], [demand['num_slots']], failed_links)[0])
 
 def calculate_PLR(G, demand, path):
     '''calculate the packet loss ratio for a demand along a path in a graph'''
@@ -108,35 +82,39 @@ def calculate_PLR(G, demand, path):
 
     return primary_PLR
 
-def compute_1_1_edge_disjoint_paths(G, num_candidate_paths=10):
+def one_to_one_edge_disjoint_paths_from(G, src_id, num_candidate_paths=10, dst_ids=None):
+    '''shortest edge-disjoint paths from src_id to every node with a higher id'''
     k_paths_dict = {}
 
-    for src_id in G.nodes():
-        for dst_id in G.nodes():
-            if src_id >= dst_id:
-                continue
+    for dst_id in G.nodes():
+        if src_id >= dst_id or (dst_ids is not None and dst_id not in dst_ids):
+            continue
 
-            path_generator = nx.edge_disjoint_paths(G, src_id, dst_id)
+        path_generator = nx.edge_disjoint_paths(G, src_id, dst_id)
 
-            shortest_paths = []
-            for path in path_generator:
-                cost = len(path) - 1
-                heapq.heappush(shortest_paths, (cost, path))
-                if len(shortest_paths) > num_candidate_paths:
-                    heapq.heappop(shortest_paths)
+        shortest_paths = []
+        for path in path_generator:
+            cost = len(path) - 1
+            heapq.heappush(shortest_paths, (cost, path))
+            if len(shortest_paths) > num_candidate_paths:
+                heapq.heappop(shortest_paths)
 
-            k_paths_dict[(src_id, dst_id)] = []
-            for path_ind, short_path in enumerate(shortest_paths):
-                if path_ind == num_candidate_paths:
-                    break
-                else:
-                    k_paths_dict[(src_id, dst_id)].append(short_path[1])
+        k_paths_dict[(src_id, dst_id)] = []
+        for path_ind, short_path in enumerate(shortest_paths):
+            if path_ind == num_candidate_paths:
+                break
+            else:
+                k_paths_dict[(src_id, dst_id)].append(short_path[1])
 
-            if len(k_paths_dict[(src_id, dst_id)]) == 0:
-                k_paths_dict[(src_id, dst_id)] = None
+        if len(k_paths_dict[(src_id, dst_id)]) == 0:
+            k_paths_dict[(src_id, dst_id)] = None
 
     return k_paths_dict
 
+
+def compute_1_1_edge_disjoint_paths(G, num_candidate_paths=10, num_workers=1):
+    return compute_paths_per_source(G, one_to_one_edge_disjoint_paths_from, num_candidate_paths, num_workers)
+
 # def k_shortest_path_first_fit_1_to_1_RSA(G, k_SP_dict, traffic_dict):
 #     chosen_paths = {}
 #
@@ -178,80 +156,54 @@ def compute_1_1_edge_disjoint_paths(G, num_candidate_paths=10):
 #
 #     return chosen_paths
 
-def proactive_1_to_1_protection(G, k_11_dict, traffic_dict, interval):
-    # initialize path status dictionary
-    path_status = {}
-    for demand, paths in k_11_dict.items():
-        path_status[demand] = {'primary': paths[0], 'backup': paths[1], 'active': 'primary', 'last_checked': 0}
+def proactive_1_to_1_protection(G, k_11_dict, traffic_dict, interval, duration=None, max_concurrent_probes=64):
+    # a failing primary path switches the demand to its backup path
+    def probe(demand, status):
+        return is_path_working(G, status['primary'], traffic_dict[demand]) == 0
 
-    while True:
-        for demand, status in path_status.items():
-            # check if it's time to test the primary path
-            if time.time() - status['last_checked'] >= interval:
-                # test primary path
-                primary_working = is_path_working(G, status['primary'], traffic_dict[demand])
-                if not primary_working:
-                    # switch to backup path
-                    status['active'] = 'backup'
-                    print(f"Switching demand {demand} to backup path")
-
-                # update last checked time
-                status['last_checked'] = time.time()
+    monitor = PathMonitor(probe, max_concurrent_probes=max_concurrent_probes)
+    for demand, paths in k_11_dict.items():
+        monitor.add(demand, paths[0], paths[1], interval)
 
-        # sleep for the interval
-        time.sleep(interval)
+    # runs until interrupted, or for duration seconds
+    asyncio.run(monitor.run(duration))
+    return monitor.path_status
 
 
 def is_path_working_1_to(G, path, demand):
-    # extract demand parameters
-    num_slots = demand['num_slots']
-    first_slot = demand['first_slot']
-
-    # check if there are enough free slots in the spectrum
-    for link in zip(path, path[1:]):
-        for i in range(first_slot, first_slot + num_slots):
-            if G.edges[link]['spectrum_slots'][i] != 0:
-                return False
-
-    # mark the slots as reserved for the demand
-    for link in zip(path, path[1:]):
-        for i in range(first_slot, first_slot + num_slots):
-            G.edges[link]['spectrum_slots'][i] = demand['demand_id']
-
-    return True
-
-def calculate_1_to_1_PLR(G, k_paths, traffic_dict):
-    '''Calculate the path loss ratio (PLR) for each demand in a 1-to-1 protection scheme'''
-
-    PLRs = []
-
-    for (src_id, dst_id), traffic_G in traffic_dict.items():
-        # get the primary and backup paths for this demand
-        primary_path, backup_path = k_paths[(src_id, dst_id)]
-
-        # if both paths are None, there is no protection for this demand
-        if primary_path is None and backup_path is None:
-            PLRs.append(1.0)
-            continue
-
-        # calculate the PLR for the primary path
-        primary_PLR = calculate_PLR(G, (src_id, dst_id), primary_path)
-
-        # if the primary path PLR is below the threshold, we don't need to check the backup path
-        if primary_PLR <= 0.1:
-            PLRs.append(primary_PLR)
-            continue
-
-        # calculate the PLR for the backup path
-        backup_PLR = calculate_PLR(G, (src_id, dst_id), backup_path)
-
-        # choose the path with the lowest PLR
-        if primary_PLR <= backup_PLR:
-            PLRs.append(primary_PLR)
-        else:
-            PLRs.append(backup_PLR)
-
-    return PLRs
+    '''whether the demand slots are free on every link of the path'''
+    store = G.graph['spectrum']
+    return store.is_free(store.path_edge_ids(path), demand['first_slot'], demand['num_slots'])
+
+def calculate_1_to_1_PLR(G, k_paths, traffic_dict, allocations, failed_links=None, threshold=0.1):
+    '''Calculate the path loss ratio (PLR) for each demand in a 1-to-1 protection scheme
+
+    k_paths are the chosen paths returned by k_shortest_path_first_fit_1_to_1_RSA and allocations the records it
+    filled: the primary of a demand is its first record and the backup its second one, if any. Blocked demands and
+    paths without a record have a PLR of 1. All the primaries are probed in one batch, then the backups of the
+    primaries above the threshold in a second one.
+    '''
+    demands = list(traffic_dict.keys())
+    records = [allocations.get(demand, []) if k_paths.get(demand) is not None else [] for demand in demands]
+
+    def probe_batch(indices, position):
+        probed = [(i, records[i][position]) for i in indices if len(records[i]) > position]
+        result = np.ones(len(demands))
+        if probed:
+            indices, probed_records = zip(*probed)
+            paths, first_slots, num_slots_list, _ = zip(*probed_records)
+            result[list(indices)] = probe_paths(G, paths, first_slots, num_slots_list, failed_links)
+        return result
+
+    # calculate the PLR for the primary paths
+    PLRs = probe_batch(range(len(demands)), 0)
+
+    # the backups only matter where the primary is above the threshold, keep the lowest PLR
+    above = np.flatnonzero(PLRs > threshold)
+    if len(above):
+        PLRs = np.minimum(PLRs, probe_batch(above, 1))
+
+    return PLRs.tolist()
 
 # check num of spectrum used
 
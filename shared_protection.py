@@ -0,0 +1,141 @@
+import itertools
+import pickle
+
+import numpy as np
+
+from spectrum import first_free_block
+
+
+def cheapest_backup(sharing, edge_ids_list, num_slots_list, primary_bitset):
+    '''(candidate index, first slot) of the backup candidate adding the fewest new backup cells, None if none fits
+
+    Every candidate gets its First-Fit block on the sharing ledger and is ranked by how much of that block overlaps
+    the backup cells already held on its links, the earlier candidate first on ties. The search stops at a
+    candidate fully held by shareable backups.
+    '''
+    best = None
+    for i, (edge_ids, num_slots) in enumerate(zip(edge_ids_list, num_slots_list)):
+        first_slot = sharing.first_fit(edge_ids, num_slots, primary_bitset)
+        if first_slot is None:
+            continue
+        new_cells = sharing.new_cells(edge_ids, first_slot, num_slots)
+        if best is None or new_cells < best[0]:
+            best = (new_cells, i, first_slot)
+            if not new_cells:
+                break
+    return None if best is None else best[1:]
+
+
+def path_bitset(edge_ids):
+    '''links of a path as an integer with one bit per edge id'''
+    bitset = 0
+    for edge_id in edge_ids.tolist():
+        bitset |= 1 << edge_id
+    return bitset
+
+
+class BackupSharing:
+    '''spectrum pool of the shared backups
+
+    Every (link, slot) cell held by backups keeps the primary path bitsets of its sharers and their union. A new
+    backup may reuse a cell when its primary is link-disjoint from all the sharers' primaries, so that no single
+    link failure needs the cell twice: the check is one AND against the union.
+    '''
+
+    __slots__ = ('store', 'backup_cells', 'sharers', 'primary_union', 'next_id')
+
+    def __init__(self, store):
+        self.store = store
+
+        # cells held by backups, the other occupied cells belong to working paths
+        self.backup_cells = np.zeros(store.slots.shape, dtype=bool)
+
+        # {(edge_id, slot): {sharing_id: primary bitset}} and {(edge_id, slot): OR of those bitsets}
+        self.sharers = {}
+        self.primary_union = {}
+        self.next_id = itertools.count()
+
+    def usable_occupation(self, edge_ids, primary_bitset):
+        '''occupation row of a backup path, where the cells it may share count as free'''
+        occupied = self.store.slots[edge_ids] != 0
+        shared = self.backup_cells[edge_ids]
+
+        # cells of working paths are never shared
+        blocked = (occupied & ~shared).any(axis=0)
+
+        # backup cells are shared unless one of their sharers' primaries crosses our primary
+        for slot in np.flatnonzero(shared.any(axis=0) & ~blocked).tolist():
+            for edge_id in edge_ids[shared[:, slot]].tolist():
+                if self.primary_union[(edge_id, slot)] & primary_bitset:
+                    blocked[slot] = True
+                    break
+        return blocked
+
+    def first_fit(self, edge_ids, num_slots, primary_bitset):
+        return first_free_block(self.usable_occupation(edge_ids, primary_bitset), num_slots)
+
+    def new_cells(self, edge_ids, first_slot, num_slots):
+        '''cells of a backup block that no backup holds yet, the spectrum it would take on top of the shared one'''
+        return len(edge_ids) * num_slots - int(self.backup_cells[edge_ids, first_slot:first_slot + num_slots].sum())
+
+    def allocate(self, edge_ids, first_slot, num_slots, primary_bitset):
+        '''hold a backup block for a primary, returns the sharing id needed to release it'''
+        sharing_id = next(self.next_id)
+        self.store.occupy(edge_ids, first_slot, num_slots)
+        self.backup_cells[edge_ids, first_slot:first_slot + num_slots] = True
+        for edge_id in edge_ids.tolist():
+            for slot in range(first_slot, first_slot + num_slots):
+                cell = (edge_id, slot)
+                self.sharers.setdefault(cell, {})[sharing_id] = primary_bitset
+                self.primary_union[cell] = self.primary_union.get(cell, 0) | primary_bitset
+        return sharing_id
+
+    def release(self, sharing_id, edge_ids, first_slot, num_slots):
+        '''drop one backup block, the cells are freed once their last sharer is gone'''
+        freed_edge_ids = []
+        freed_slots = []
+        for edge_id in edge_ids.tolist():
+            for slot in range(first_slot, first_slot + num_slots):
+                cell = (edge_id, slot)
+                cell_sharers = self.sharers[cell]
+                del cell_sharers[sharing_id]
+                if cell_sharers:
+                    union = 0
+                    for primary_bitset in cell_sharers.values():
+                        union |= primary_bitset
+                    self.primary_union[cell] = union
+                else:
+                    del self.sharers[cell]
+                    del self.primary_union[cell]
+                    freed_edge_ids.append(edge_id)
+                    freed_slots.append(slot)
+
+        if freed_edge_ids:
+            self.backup_cells[freed_edge_ids, freed_slots] = False
+            self.store.release_cells(freed_edge_ids, freed_slots)
+
+    def copy(self, store):
+        '''independent ledger over store, a copy of the spectrum this ledger describes'''
+        sharing = BackupSharing.__new__(BackupSharing)
+        sharing.store = store
+        sharing.backup_cells = self.backup_cells.copy()
+        sharing.sharers = {cell: dict(cell_sharers) for cell, cell_sharers in self.sharers.items()}
+        sharing.primary_union = dict(self.primary_union)
+        # sharing ids only need to be unique within one ledger
+        sharing.next_id = itertools.count(next(self.next_id))
+        return sharing
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            pickle.dump((self.backup_cells, self.sharers, self.primary_union, next(self.next_id)), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, filename, store):
+        '''ledger written by save, over the store of the same checkpoint'''
+        sharing = cls.__new__(cls)
+        sharing.store = store
+        with open(filename, 'rb') as f:
+            sharing.backup_cells, sharing.sharers, sharing.primary_union, next_id = pickle.load(f)
+        sharing.next_id = itertools.count(next_id)
+        return sharing
@@ -0,0 +1,127 @@
+import argparse
+import heapq
+import itertools
+import random
+
+from function import read_topology, clear_spectrum, release_allocations, spectrum_occupation, get_resource_ledger
+from experiment import schemes
+from path_cache import load_candidate_paths
+from path_engine import compute_k_disjoint_paths
+from path_table import traffic_classes
+
+ARRIVAL = 0
+DEPARTURE = 1
+
+
+def simulate(G, k_paths, scheme='1+1', arrival_rate=10.0, mean_holding_time=1.0, num_arrivals=100000,
+             seed=0, num_slots=400, warmup=0, sample_interval=None):
+    '''dynamic traffic: Poisson arrivals with exponential holding times, allocated and released by one scheme
+
+    The load in Erlang is arrival_rate * mean_holding_time. Blocking counts skip the first warmup arrivals,
+    utilization is the time average of the occupied share of all the (link, slot) cells.
+    '''
+    RSA = schemes[scheme][0]
+    # protected demands need both their paths, 1:1 holds only the working one
+    min_allocations = 1 if scheme == '1:1' else 2
+
+    G.graph['num_slots'] = num_slots
+    clear_spectrum(G, num_slots)
+    ledger = get_resource_ledger(G)
+    num_cells = G.number_of_edges() * num_slots
+
+    rng = random.Random(seed)
+    pairs = [pair for pair, paths in k_paths.items() if paths]
+    departure_rate = 1 / mean_holding_time
+
+    # (time, sequence number, event kind, allocations of the connection)
+    events = [(rng.expovariate(arrival_rate), 0, ARRIVAL, None)]
+    sequence = itertools.count(1)
+
+    arrivals = 0
+    blocked = 0
+    offered_Gbit = 0
+    blocked_Gbit = 0
+    occupied_area = 0.0
+    transponder_area = 0.0
+    measured_time = 0.0
+    last_time = 0.0
+    next_sample = 0.0
+    samples = []
+
+    while events:
+        time, _, kind, connection = heapq.heappop(events)
+
+        # the occupation is constant between events
+        if arrivals > warmup:
+            occupied_area += spectrum_occupation(G) * (time - last_time)
+            transponder_area += ledger.transponders.get(scheme, 0) * (time - last_time)
+            measured_time += time - last_time
+        last_time = time
+        if sample_interval is not None:
+            while next_sample <= time:
+                samples.append((next_sample, spectrum_occupation(G) / num_cells))
+                next_sample += sample_interval
+
+        if kind == DEPARTURE:
+            release_allocations(G, connection, scheme)
+            continue
+
+        arrivals += 1
+        if arrivals < num_arrivals:
+            heapq.heappush(events, (time + rng.expovariate(arrival_rate), next(sequence), ARRIVAL, None))
+
+        pair = pairs[int(rng.random() * len(pairs))]
+        traffic_G = traffic_classes[int(rng.random() * len(traffic_classes))]
+
+        allocations = {}
+        RSA(G, k_paths, {pair: traffic_G}, allocations)
+        connection = allocations.get(pair, [])
+
+        if arrivals > warmup:
+            offered_Gbit += traffic_G
+        if len(connection) < min_allocations:
+            # blocked, give back whatever was taken
+            release_allocations(G, connection, scheme)
+            if arrivals > warmup:
+                blocked += 1
+                blocked_Gbit += traffic_G
+        else:
+            departure_time = time + rng.expovariate(departure_rate)
+            heapq.heappush(events, (departure_time, next(sequence), DEPARTURE, connection))
+
+    measured_arrivals = max(arrivals - warmup, 0)
+    return {'scheme': scheme,
+            'load_erlang': arrival_rate * mean_holding_time,
+            'arrivals': measured_arrivals,
+            'blocked': blocked,
+            'blocking_probability': blocked / measured_arrivals if measured_arrivals else 0.0,
+            'bandwidth_blocking': blocked_Gbit / offered_Gbit if offered_Gbit else 0.0,
+            'mean_utilization': occupied_area / measured_time / num_cells if measured_time else 0.0,
+            'mean_transponders': transponder_area / measured_time if measured_time else 0.0,
+            'utilization_samples': samples}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='event-driven dynamic traffic simulation of one protection scheme')
+    parser.add_argument('--topology', default='IT_21.json')
+    parser.add_argument('--scheme', default='1+1', choices=list(schemes))
+    parser.add_argument('--load', type=float, default=100.0, help='offered load in Erlang')
+    parser.add_argument('--arrivals', type=int, default=100000)
+    parser.add_argument('--warmup', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--num-slots', type=int, default=400)
+    args = parser.parse_args()
+
+    G = read_topology(args.topology)
+    G.graph['num_slots'] = args.num_slots
+    k_paths = load_candidate_paths(args.topology, G, compute_k_disjoint_paths)
+
+    stats = simulate(G, k_paths, args.scheme, arrival_rate=args.load, mean_holding_time=1.0,
+                     num_arrivals=args.arrivals, seed=args.seed, num_slots=args.num_slots, warmup=args.warmup)
+    for name, value in stats.items():
+        if name != 'utilization_samples':
+            print(name, value)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import numpy as np
+
+from free_blocks import FreeBlockIndex
+
+
+class SpectrumStore:
+    '''spectrum occupation of all the links kept in one contiguous edges x slots array'''
+
+    __slots__ = ('num_slots', 'edge_index', 'incident_edge_ids', 'slots', 'num_occupied', 'free_blocks')
+
+    def __init__(self, G, num_slots=400):
+        self.num_slots = num_slots
+
+        self.edge_index = edge_index(G)
+
+        # edge ids of the links G.edges(node) lists for every node
+        self.incident_edge_ids = {node: np.array([self.edge_index[link] for link in G.edges(node)], dtype=np.intp)
+                                  for node in G.nodes()}
+
+        # one row per link, 1 marks an occupied slot
+        self.slots = np.zeros((G.number_of_edges(), num_slots), dtype=np.uint8)
+
+        # running number of occupied (link, slot) cells
+        self.num_occupied = 0
+
+        # optional FreeBlockIndex, see index_free_blocks
+        self.free_blocks = None
+
+    def copy(self):
+        '''independent store with the same links and a copy of the occupation'''
+        store = SpectrumStore.__new__(SpectrumStore)
+        store.num_slots = self.num_slots
+        store.edge_index = self.edge_index
+        store.incident_edge_ids = self.incident_edge_ids
+        store.slots = self.slots.copy()
+        store.num_occupied = self.num_occupied
+        store.free_blocks = None if self.free_blocks is None else FreeBlockIndex(store.slots)
+        return store
+
+    def index_free_blocks(self):
+        '''keep a FreeBlockIndex of the free blocks of every link, used by first_fit from then on'''
+        if self.free_blocks is None:
+            self.free_blocks = FreeBlockIndex(self.slots)
+        return self.free_blocks
+
+    def snapshot(self):
+        '''copy of the occupation, for restore'''
+        return self.slots.copy(), self.num_occupied
+
+    def restore(self, snapshot):
+        '''bring the occupation back to a snapshot, in place so that the link row views stay valid'''
+        slots, num_occupied = snapshot
+        np.copyto(self.slots, slots)
+        self.num_occupied = num_occupied
+        if self.free_blocks is not None:
+            self.free_blocks = FreeBlockIndex(self.slots)
+
+    def save_checkpoint(self, filename):
+        '''write the occupation to a .npy file that open_checkpoint can memory-map'''
+        np.save(filename, self.slots)
+
+    def open_checkpoint(self, filename, mode='c'):
+        '''store with the same links on a memory-mapped checkpoint
+
+        With mode 'c' the store is a copy-on-write fork: pages are read from the file on first use and copied only
+        when written, the file never changes. Mode 'r+' writes through to the file.
+        '''
+        store = SpectrumStore.__new__(SpectrumStore)
+        store.num_slots = self.num_slots
+        store.edge_index = self.edge_index
+        store.incident_edge_ids = self.incident_edge_ids
+        store.slots = np.load(filename, mmap_mode=mode)
+        if store.slots.shape != self.slots.shape:
+            raise ValueError('checkpoint {} does not match the links and slots of the store'.format(filename))
+        store.num_occupied = int(np.count_nonzero(store.slots))
+        store.free_blocks = None if self.free_blocks is None else FreeBlockIndex(store.slots)
+        return store
+
+    def path_edge_ids(self, path):
+        '''edge ids of the links along a node path'''
+        return np.fromiter((self.edge_index[link] for link in zip(path, path[1:])),
+                           dtype=np.intp, count=max(len(path) - 1, 0))
+
+    def link_slots(self, link):
+        '''view of the slot row of a single link'''
+        return self.slots[self.edge_index[link]]
+
+    def is_free(self, edge_ids, first_slot, num_slots):
+        '''whether slots [first_slot, first_slot + num_slots) are free on all the given links'''
+        return not self.slots[edge_ids, first_slot:first_slot + num_slots].any()
+
+    def lost_share(self, edge_ids_list, first_slots, num_slots_list, failed_links=None):
+        '''share of the (link, slot) cells of every path that are no longer held or sit on a failed link
+
+        Read-only and batched: path i covers slots [first_slots[i], first_slots[i] + num_slots_list[i]) on the
+        links edge_ids_list[i]. failed_links is an optional boolean array indexed by edge id.
+        '''
+        num_paths = len(edge_ids_list)
+        hops = np.fromiter((len(edge_ids) for edge_ids in edge_ids_list), dtype=np.intp, count=num_paths)
+        cells = hops * np.asarray(num_slots_list, dtype=np.intp)
+        if not cells.sum():
+            return np.zeros(num_paths)
+
+        cell_edge_ids, cell_slots = path_cells(edge_ids_list, first_slots, num_slots_list)
+
+        in_band = cell_slots < self.num_slots
+        held = in_band & (self.slots[cell_edge_ids, np.where(in_band, cell_slots, 0)] != 0)
+        if failed_links is not None:
+            held &= ~failed_links[cell_edge_ids]
+
+        lost = np.bincount(np.repeat(np.arange(num_paths), cells), weights=~held, minlength=num_paths)
+        return np.divide(lost, cells, out=np.zeros(num_paths), where=cells > 0)
+
+    def occupy(self, edge_ids, first_slot, num_slots):
+        '''mark slots [first_slot, first_slot + num_slots) as occupied on the given links'''
+        block = self.slots[edge_ids, first_slot:first_slot + num_slots]
+        self.num_occupied += block.size - int(np.count_nonzero(block))
+        self.slots[edge_ids, first_slot:first_slot + num_slots] = 1
+        if self.free_blocks is not None:
+            self.free_blocks.occupy(edge_ids, first_slot, num_slots)
+
+    def release(self, edge_ids, first_slot, num_slots):
+        '''mark slots [first_slot, first_slot + num_slots) as free on the given links'''
+        block = self.slots[edge_ids, first_slot:first_slot + num_slots]
+        self.num_occupied -= int(np.count_nonzero(block))
+        self.slots[edge_ids, first_slot:first_slot + num_slots] = 0
+        if self.free_blocks is not None:
+            self.free_blocks.release(edge_ids, first_slot, num_slots)
+
+    def release_cells(self, edge_ids, slots):
+        '''mark the single (edge_ids[i], slots[i]) cells as free'''
+        self.num_occupied -= int(np.count_nonzero(self.slots[edge_ids, slots]))
+        self.slots[edge_ids, slots] = 0
+        if self.free_blocks is not None:
+            self.free_blocks.release_cells(edge_ids, slots)
+
+    def clear(self):
+        '''free every slot of every link'''
+        self.slots.fill(0)
+        self.num_occupied = 0
+        if self.free_blocks is not None:
+            self.free_blocks.clear()
+
+    def occupation(self):
+        '''number of occupied (link, slot) cells'''
+        return self.num_occupied
+
+    def first_fit(self, edge_ids, num_slots):
+        '''lowest slot starting num_slots contiguous slots free on all the given links, None if there is none'''
+        if self.free_blocks is not None and num_slots > 0:
+            return self.free_blocks.first_fit(edge_ids, num_slots)
+        occupied = np.bitwise_or.reduce(self.slots[edge_ids], axis=0)
+        return first_free_block(occupied, num_slots)
+
+    def first_fit_paths(self, edge_ids_list, num_slots_list):
+        '''first fit of several paths in one pass, -1 marks a path without a fitting block'''
+        num_paths = len(edge_ids_list)
+        if num_paths == 0:
+            return np.empty(0, dtype=np.intp)
+
+        # OR the slot rows of each path's links into one occupation row per path
+        hops = np.fromiter((len(edge_ids) for edge_ids in edge_ids_list), dtype=np.intp, count=num_paths)
+        offsets = np.zeros(num_paths, dtype=np.intp)
+        np.cumsum(hops[:-1], out=offsets[1:])
+        occupied = np.bitwise_or.reduceat(self.slots[np.concatenate(edge_ids_list)], offsets, axis=0)
+
+        # free slot prefix sums, a window is free when its sum equals its width
+        free_count = np.zeros((num_paths, self.num_slots + 1), dtype=np.int32)
+        np.cumsum(occupied == 0, axis=1, out=free_count[:, 1:])
+
+        widths = np.asarray(num_slots_list, dtype=np.intp)[:, None]
+        starts = np.arange(self.num_slots)[None, :]
+        ends = starts + widths
+        rows = np.arange(num_paths)[:, None]
+        fits = (ends <= self.num_slots) & \
+               (free_count[rows, np.minimum(ends, self.num_slots)] - free_count[rows, starts] == widths)
+
+        return np.where(fits.any(axis=1), fits.argmax(axis=1), -1)
+
+
+def edge_index(G):
+    '''dense edge id for every link, both directions map to the same id on undirected graphs'''
+    index = {}
+    for edge_id, (u, v) in enumerate(G.edges()):
+        index[(u, v)] = edge_id
+        if not G.is_directed():
+            index[(v, u)] = edge_id
+    return index
+
+
+def path_cells(edge_ids_list, first_slots, num_slots_list):
+    '''(edge ids, slots) of every (link, slot) cell of the paths, path by path and link by link
+
+    Path i covers slots [first_slots[i], first_slots[i] + num_slots_list[i]) on the links edge_ids_list[i].
+    '''
+    num_paths = len(edge_ids_list)
+    if num_paths == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    hops = np.fromiter((len(edge_ids) for edge_ids in edge_ids_list), dtype=np.intp, count=num_paths)
+
+    # one entry per (path, link, slot) cell
+    hop_edge_ids = np.concatenate(edge_ids_list).astype(np.intp)
+    hop_num_slots = np.repeat(np.asarray(num_slots_list, dtype=np.intp), hops)
+    hop_first_slots = np.repeat(np.asarray(first_slots, dtype=np.intp), hops)
+    cell_edge_ids = np.repeat(hop_edge_ids, hop_num_slots)
+    cell_offsets = np.arange(len(cell_edge_ids)) - np.repeat(np.cumsum(hop_num_slots) - hop_num_slots, hop_num_slots)
+    return cell_edge_ids, np.repeat(hop_first_slots, hop_num_slots) + cell_offsets
+
+
+def first_free_block(occupied, num_slots):
+    '''lowest start of num_slots contiguous zeros in an occupation row, None if there is none'''
+    if num_slots > len(occupied):
+        return None
+    if num_slots <= 0:
+        return 0
+
+    free_count = np.zeros(len(occupied) + 1, dtype=np.int32)
+    np.cumsum(occupied == 0, out=free_count[1:])
+    fits = free_count[num_slots:] - free_count[:-num_slots] == num_slots
+
+    first_slot = int(fits.argmax())
+    if not fits[first_slot]:
+        return None
+    return first_slot
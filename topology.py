@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+
+import networkx as nx
+import numpy as np
+
+from function import read_topology
+from path_cache import topology_hash
+
+_arrays = ('indptr', 'indices', 'adjacent_edge_ids', 'edge_ends', 'edge_length')
+
+
+class CSRTopology:
+    '''topology compiled to arrays: dense node ids 0 .. N-1 and edge ids 0 .. E-1 in G.edges() order
+
+    The links leaving dense node i are indices[indptr[i]:indptr[i + 1]], with their edge ids in the same slice of
+    adjacent_edge_ids. Edge ids are the ones SpectrumStore and PathTable give the links of the NetworkX view.
+    '''
+
+    __slots__ = ('directed', 'graph_attributes', 'node_ids', 'node_attributes', 'node_index') + _arrays
+
+    @classmethod
+    def from_networkx(cls, G):
+        topology = cls.__new__(cls)
+        topology.directed = G.is_directed()
+        topology.graph_attributes = dict(G.graph)
+        topology.node_ids = list(G.nodes())
+        topology.node_attributes = [G.nodes[node] for node in topology.node_ids]
+        topology.node_index = {node: i for i, node in enumerate(topology.node_ids)}
+
+        links = list(G.edges(data='length'))
+        topology.edge_ends = np.array([(topology.node_index[u], topology.node_index[v]) for u, v, _ in links],
+                                      dtype=np.int32).reshape(-1, 2)
+        # integer lengths stay integers, as in the JSON
+        topology.edge_length = np.array([length for _, _, length in links]) if links else np.zeros(0)
+
+        # adjacency entries sorted by their source node, both directions of every link on undirected graphs
+        edge_ids = np.arange(len(links), dtype=np.int32)
+        sources, targets = topology.edge_ends[:, 0], topology.edge_ends[:, 1]
+        if not topology.directed:
+            sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+            edge_ids = np.concatenate([edge_ids, edge_ids])
+        order = np.argsort(sources, kind='stable')
+        topology.indices = targets[order]
+        topology.adjacent_edge_ids = edge_ids[order]
+        topology.indptr = np.zeros(len(topology.node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(topology.node_ids)), out=topology.indptr[1:])
+        return topology
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.edge_length)
+
+    def neighbors(self, i):
+        '''dense ids of the nodes reached from dense node i, and the edge ids of the links to them'''
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.adjacent_edge_ids[start:end]
+
+    def to_networkx(self):
+        '''NetworkX graph with the original node ids and attributes, and the same G.edges() order'''
+        G = nx.DiGraph(**self.graph_attributes) if self.directed else nx.Graph(**self.graph_attributes)
+        for node, attributes in zip(self.node_ids, self.node_attributes):
+            G.add_node(node, **attributes)
+
+        # links added in edge id order come back in that order from G.edges()
+        node_ids = self.node_ids
+        for (u, v), length in zip(self.edge_ends.tolist(), self.edge_length.tolist()):
+            G.add_edge(node_ids[u], node_ids[v], length=length)
+        return G
+
+    def save(self, folder):
+        '''one .npy file per array, so that load can memory-map them, and the node data as JSON'''
+        os.makedirs(folder, exist_ok=True)
+        for name in _arrays:
+            np.save(os.path.join(folder, name + '.npy'), getattr(self, name))
+        with open(os.path.join(folder, 'nodes.json'), 'w') as f:
+            json.dump({'directed': self.directed, 'graph': self.graph_attributes, 'node_ids': self.node_ids,
+                       'node_attributes': self.node_attributes}, f)
+
+    @classmethod
+    def load(cls, folder, mmap_mode='r'):
+        topology = cls.__new__(cls)
+        for name in _arrays:
+            setattr(topology, name, np.load(os.path.join(folder, name + '.npy'), mmap_mode=mmap_mode))
+        with open(os.path.join(folder, 'nodes.json')) as f:
+            nodes = json.load(f)
+        topology.directed = nodes['directed']
+        topology.graph_attributes = nodes['graph']
+        topology.node_ids = nodes['node_ids']
+        topology.node_attributes = nodes['node_attributes']
+        topology.node_index = {node: i for i, node in enumerate(topology.node_ids)}
+        return topology
+
+
+def load_topology(filename, cache_dir='topology_cache'):
+    '''CSRTopology of a node-link JSON file, compiled on the first call and memory-mapped from the cache after'''
+    name = os.path.splitext(os.path.basename(filename))[0]
+    folder = os.path.join(cache_dir, '{}_{}'.format(name, topology_hash(filename)))
+    if os.path.isdir(folder):
+        return CSRTopology.load(folder)
+
+    # compile into a temporary folder first so an interrupted run never leaves a partial cache entry
+    tmp_folder = '{}.{}.tmp'.format(folder, os.getpid())
+    CSRTopology.from_networkx(read_topology(filename)).save(tmp_folder)
+    try:
+        os.replace(tmp_folder, folder)
+    except OSError:
+        # another process cached it first
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+    return CSRTopology.load(folder)
+
+
+def read_topology_cached(filename, cache_dir='topology_cache'):
+    '''drop-in replacement of read_topology going through the compiled cache, the CSR is kept in G.graph['csr']'''
+    topology = load_topology(filename, cache_dir)
+    G = topology.to_networkx()
+    G.graph['csr'] = topology
+    return G
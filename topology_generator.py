@@ -0,0 +1,96 @@
+import json
+
+import networkx as nx
+import numpy as np
+
+
+def _euclidean_lengths(positions, links):
+    '''link lengths in km, rounded like the lengths of the reference topologies'''
+    links = np.asarray(links, dtype=np.intp).reshape(-1, 2)
+    lengths = np.linalg.norm(positions[links[:, 0]] - positions[links[:, 1]], axis=1)
+    return np.maximum(np.round(lengths), 1)
+
+
+def _topology(name, positions, links):
+    G = nx.Graph(name=name)
+    for node, (x, y) in enumerate(positions.tolist()):
+        G.add_node(node, name='N{}'.format(node), x=x, y=y)
+    for (u, v), length in zip(links, _euclidean_lengths(positions, links).tolist()):
+        G.add_edge(int(u), int(v), length=length)
+    return G
+
+
+def _connect_components(G, positions):
+    '''link every other component to the first one through its closest pair of nodes'''
+    components = [np.fromiter(component, dtype=np.intp) for component in nx.connected_components(G)]
+    main = components[0]
+    for component in components[1:]:
+        distances = np.linalg.norm(positions[main][:, None] - positions[component][None, :], axis=2)
+        i, j = np.unravel_index(np.argmin(distances), distances.shape)
+        u, v = int(main[i]), int(component[j])
+        G.add_edge(u, v, length=float(max(round(distances[i, j]), 1)))
+        main = np.concatenate([main, component])
+
+
+def waxman_topology(num_nodes, mean_degree=3.5, alpha=0.25, area_km=2000, seed=0):
+    '''Waxman random graph on an area_km square, connected, with about mean_degree links per node
+
+    Link (u, v) is drawn with a probability proportional to exp(-d(u, v) / (alpha * L)), L the largest distance,
+    scaled so that the expected number of links gives mean_degree.
+    '''
+    rng = np.random.default_rng(seed)
+    positions = rng.random((num_nodes, 2)) * area_km
+
+    u, v = np.triu_indices(num_nodes, k=1)
+    distances = np.linalg.norm(positions[u] - positions[v], axis=1)
+    weights = np.exp(-distances / (alpha * distances.max()))
+    probability = np.minimum(weights * (num_nodes * mean_degree / 2 / weights.sum()), 1)
+    drawn = rng.random(len(u)) < probability
+
+    G = _topology('waxman_{}'.format(num_nodes), positions, np.column_stack([u[drawn], v[drawn]]))
+    _connect_components(G, positions)
+    return G
+
+
+def grid_topology(num_nodes, spacing_km=150):
+    '''rows x columns grid of about num_nodes nodes, as square as possible'''
+    rows = max(int(np.sqrt(num_nodes)), 1)
+    columns = max(num_nodes // rows, 1)
+    row, column = np.divmod(np.arange(rows * columns), columns)
+    positions = np.column_stack([column, row]).astype(float) * spacing_km
+
+    node = np.arange(rows * columns).reshape(rows, columns)
+    links = np.concatenate([np.column_stack([node[:, :-1].ravel(), node[:, 1:].ravel()]),
+                            np.column_stack([node[:-1, :].ravel(), node[1:, :].ravel()])])
+    return _topology('grid_{}x{}'.format(rows, columns), positions, links)
+
+
+def ring_mesh_topology(num_nodes, num_chords=None, ring_km=None, seed=0):
+    '''ring of num_nodes nodes on a circle, meshed with random chords, num_nodes // 2 by default'''
+    rng = np.random.default_rng(seed)
+    if num_chords is None:
+        num_chords = num_nodes // 2
+    if ring_km is None:
+        ring_km = 100 * num_nodes
+    angle = 2 * np.pi * np.arange(num_nodes) / num_nodes
+    positions = np.column_stack([np.cos(angle), np.sin(angle)]) * ring_km / (2 * np.pi)
+
+    ring = np.arange(num_nodes)
+    links = {(int(u), int(v)) for u, v in zip(ring, np.roll(ring, -1)) if u != v}
+    # chords skip at least one ring neighbour, drawn until enough distinct ones are found
+    while len(links) < num_nodes + num_chords and num_nodes > 3:
+        u, v = sorted(rng.choice(num_nodes, 2, replace=False).tolist())
+        if v - u > 1 and (u, v) != (0, num_nodes - 1):
+            links.add((u, v))
+    return _topology('ring_mesh_{}'.format(num_nodes), positions, sorted(links))
+
+
+generators = {'waxman': waxman_topology,
+              'grid': lambda num_nodes, seed=0: grid_topology(num_nodes),
+              'ring-mesh': ring_mesh_topology}
+
+
+def write_topology(G, filename):
+    '''node-link JSON readable by read_topology'''
+    with open(filename, 'w') as f:
+        json.dump(nx.json_graph.node_link_data(G), f)
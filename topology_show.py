@@ -1,25 +1,25 @@
-import json
 import networkx as nx
 import matplotlib.pyplot as plt
 
-# load the graph from the json file
-with open('IT_21.json', 'r') as f:
-    graph_data = json.load(f)
+from topology import load_topology
 
-# create a directed graph object from the json data
+# load the compiled topology, the JSON is only parsed the first time
+topology = load_topology('IT_21.json')
+
+# create a directed graph object from the compiled topology
 G = nx.DiGraph()
 
 # add nodes to the graph
-for node in graph_data['nodes']:
-    G.add_node(node['id'], name=node['name'])
+for node, attributes in zip(topology.node_ids, topology.node_attributes):
+    G.add_node(node, name=attributes['name'])
 
 # add edges to the graph
-for link in graph_data['links']:
-    G.add_edge(link['source'], link['target'], weight=link['length'])
+for (u, v), length in zip(topology.edge_ends.tolist(), topology.edge_length.tolist()):
+    G.add_edge(topology.node_ids[u], topology.node_ids[v], weight=length)
 
 # draw the graph
 pos = nx.spring_layout(G)
-labels = {node['id']: node['name'] for node in graph_data['nodes']}
+labels = nx.get_node_attributes(G, 'name')
 nx.draw(G, pos, with_labels=True, labels=labels, node_color='lightblue', edge_color='gray', font_size=8, node_size=500)
 edge_labels = nx.get_edge_attributes(G,'weight')
 nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=8)